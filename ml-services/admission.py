@@ -0,0 +1,131 @@
+# admission.py - Per-endpoint concurrency limits with bounded queues
+import math
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Any
+
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+
+class Rejected(Exception):
+    """Request turned away by admission control"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class EndpointLimiter:
+    """At most `concurrency` requests in flight, `queue_size` more waiting.
+
+    A request arriving to a full queue gets 429 straight away; one that waits
+    longer than queue_timeout seconds gets 503. Retry-After is the time the
+    current backlog should take to drain at the measured service time.
+    """
+
+    def __init__(self, name: str, concurrency: int, queue_size: int, queue_timeout: float,
+                 alpha: float = 0.2):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.alpha = alpha
+        self._slots = asyncio.Semaphore(concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.service_ms = 0.0
+        self._waits_ms = deque(maxlen=1000)
+
+    def retry_after(self) -> int:
+        backlog = (self.waiting + 1) / self.concurrency
+        return max(1, math.ceil(backlog * self.service_ms / 1000))
+
+    async def acquire(self) -> float:
+        """Wait for a slot; returns the queue wait in ms or raises Rejected"""
+        if self._slots.locked() and self.waiting >= self.queue_size:
+            self.rejected += 1
+            raise Rejected(429, f"Too many {self.name} requests queued", self.retry_after())
+
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise Rejected(503, f"{self.name} queue wait exceeded {self.queue_timeout}s", self.retry_after())
+        finally:
+            self.waiting -= 1
+
+        waited_ms = (time.perf_counter() - start) * 1000
+        self._waits_ms.append(waited_ms)
+        self.in_flight += 1
+        self.admitted += 1
+        return waited_ms
+
+    def release(self, elapsed_ms: float):
+        self.in_flight -= 1
+        self._slots.release()
+        if self.service_ms == 0.0:
+            self.service_ms = elapsed_ms
+        else:
+            self.service_ms += self.alpha * (elapsed_ms - self.service_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._waits_ms)
+
+        def percentile(q: float) -> float:
+            return round(waits[min(len(waits) - 1, int(q * len(waits)))], 1) if waits else 0.0
+
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "service_ms": round(self.service_ms, 1),
+            "queue_wait_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "max": percentile(1.0)}
+        }
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying an EndpointLimiter per path.
+
+    Paths without a limiter (health checks, status pages) are never queued,
+    so they keep answering while the expensive endpoints are saturated.
+    """
+
+    def __init__(self, app, limiters: Dict[str, EndpointLimiter]):
+        self.app = app
+        self.limiters = limiters
+
+    async def __call__(self, scope, receive, send):
+        limiter = self.limiters.get(scope["path"]) if scope["type"] == "http" else None
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await limiter.acquire()
+        except Rejected as e:
+            logger.warning(f"Rejected {scope['path']} with {e.status_code}: {e.detail}")
+            response = JSONResponse({"detail": e.detail}, status_code=e.status_code,
+                                    headers={"Retry-After": str(e.retry_after)})
+            await response(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release((time.perf_counter() - start) * 1000)
@@ -1,5 +1,5 @@
 # app.py - FastAPI ML Microservice
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import pandas as pd
@@ -7,8 +7,15 @@ import numpy as np
 from datetime import datetime, timedelta
 import logging
 import asyncio
+import os
 from prediction import StockPredictor
 from sentiment import SentimentAnalyzer
+from workers import process_memory
+from news_pipeline import NewsIngestionPipeline, LocalNewsSource, YahooNewsSource
+from encoding import encode_response, wants_msgpack, forecast_to_columns
+from streaming import ForecastStream, BarReplayFeed
+from admission import AdmissionMiddleware, EndpointLimiter
+from materialize import MaterializationScheduler
 import json
 
 # Configure logging
@@ -21,15 +28,51 @@ warnings.filterwarnings('ignore', message='Importing plotly failed')
 
 app = FastAPI(title="StockInsight ML Service", version="1.0.0")
 
-# Initialize ML components
-predictor = StockPredictor()
-sentiment_analyzer = SentimentAnalyzer()
+def endpoint_limiter(name: str, concurrency: int, queue_size: int, queue_timeout: float) -> EndpointLimiter:
+    """Limiter with ADMISSION_<NAME>_CONCURRENCY / _QUEUE / _TIMEOUT overrides"""
+    prefix = f"ADMISSION_{name.upper()}_"
+    return EndpointLimiter(
+        name,
+        concurrency=int(os.getenv(prefix + "CONCURRENCY", concurrency)),
+        queue_size=int(os.getenv(prefix + "QUEUE", queue_size)),
+        queue_timeout=float(os.getenv(prefix + "TIMEOUT", queue_timeout))
+    )
+
+# Per-worker admission control; unlisted paths (/health, /memory, status) bypass it
+admission_limiters = {
+    "/predict": endpoint_limiter("predict", 8, 32, 10),
+    "/predict/batch": endpoint_limiter("predict_batch", 2, 4, 30),
+    "/recommend": endpoint_limiter("recommend", 4, 16, 15),
+    "/sentiment": endpoint_limiter("sentiment", 8, 32, 10),
+    "/risk-analyzer": endpoint_limiter("risk", 16, 64, 5),
+    "/train": endpoint_limiter("train", 1, 2, 1),
+}
+app.add_middleware(AdmissionMiddleware, limiters=admission_limiters)
+
+# Initialize ML components. Under `python app.py`, the materialization pool's
+# spawned workers re-import this file as __mp_main__; they build their own
+# predictor and serve nothing, so they must not load the models (FinBERT) here
+if __name__ != "__mp_main__":
+    predictor = StockPredictor()
+    sentiment_analyzer = SentimentAnalyzer()
+    # Live forecast updates for /ws/forecasts, advanced bar by bar
+    forecast_stream = ForecastStream(predictor)
+replay_feed: Optional[BarReplayFeed] = None
+materialization: Optional[MaterializationScheduler] = None
 
 # Pydantic models
 class PredictionRequest(BaseModel):
     symbol: str
     horizon: int = 7
 
+class BatchPredictionRequest(BaseModel):
+    symbols: List[str]
+    horizon: int = 7
+    model: str = "ensemble"
+
+# "fast" runs the vectorized statistical forecaster instead of Prophet+LSTM
+PREDICTION_MODELS = ("ensemble", "fast")
+
 class SentimentRequest(BaseModel):
     symbol: str
     limit: int = 10
@@ -45,6 +88,78 @@ class TrainingRequest(BaseModel):
     symbols: Optional[List[str]] = None
     retrain_all: bool = False
 
+@app.on_event("startup")
+async def start_news_pipeline():
+    """Start background news ingestion for the configured watch universe"""
+    universe = [s.strip() for s in os.getenv("NEWS_UNIVERSE", "").split(",") if s.strip()]
+    if not universe:
+        return
+    
+    # NEWS_SOURCE=local reads <NEWS_LOCAL_DIR>/<SYMBOL>.json instead of live feeds
+    if os.getenv("NEWS_SOURCE", "yahoo") == "local":
+        sources = [LocalNewsSource(os.getenv("NEWS_LOCAL_DIR", "news_fixtures"))]
+    else:
+        sources = [YahooNewsSource(sentiment_analyzer)]
+    
+    pipeline = NewsIngestionPipeline(
+        sentiment_analyzer, sources, sentiment_analyzer.store, universe,
+        interval_seconds=float(os.getenv("NEWS_POLL_SECONDS", "900"))
+    )
+    sentiment_analyzer.pipeline = pipeline
+    pipeline.start()
+    logger.info(f"News ingestion started for {len(pipeline.universe)} symbols")
+
+@app.on_event("shutdown")
+async def stop_news_pipeline():
+    if sentiment_analyzer.pipeline is not None:
+        await sentiment_analyzer.pipeline.stop()
+
+@app.on_event("startup")
+async def start_bar_replay():
+    """Drive /ws/forecasts from stored history when STREAM_REPLAY_SYMBOLS is set"""
+    global replay_feed
+    symbols = [s.strip() for s in os.getenv("STREAM_REPLAY_SYMBOLS", "").split(",") if s.strip()]
+    if not symbols:
+        return
+    
+    replay_feed = BarReplayFeed(
+        forecast_stream, os.getenv("STREAM_REPLAY_DIR", "history"), symbols,
+        replay_bars=int(os.getenv("STREAM_REPLAY_BARS", "60")),
+        interval_seconds=float(os.getenv("STREAM_REPLAY_SECONDS", "1"))
+    )
+    replay_feed.start()
+    logger.info(f"Bar replay started for {len(replay_feed.symbols)} symbols")
+
+@app.on_event("shutdown")
+async def stop_bar_replay():
+    if replay_feed is not None:
+        await replay_feed.stop()
+
+@app.on_event("startup")
+async def start_materialization():
+    """Precompute forecasts after each close for MATERIALIZE_SYMBOLS plus the most requested symbols"""
+    global materialization
+    if os.getenv("MATERIALIZE_ENABLED", "0") != "1":
+        return
+    
+    materialization = MaterializationScheduler(
+        predictor,
+        static_symbols=[s.strip() for s in os.getenv("MATERIALIZE_SYMBOLS", "").split(",") if s.strip()],
+        top_n=int(os.getenv("MATERIALIZE_TOP_N", "200")),
+        horizons=predictor.materialize_horizons,
+        run_at=os.getenv("MATERIALIZE_AT", "16:30"),
+        open_at=predictor.market_open,
+        tz=predictor.market_tz,
+        workers=predictor.materialize_workers
+    )
+    materialization.start()
+    logger.info(f"Forecast materialization enabled, daily at {os.getenv('MATERIALIZE_AT', '16:30')}")
+
+@app.on_event("shutdown")
+async def stop_materialization():
+    if materialization is not None:
+        await materialization.stop()
+
 @app.get("/")
 async def root():
     return {"message": "StockInsight ML Service", "status": "running"}
@@ -53,8 +168,21 @@ async def root():
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+@app.get("/memory")
+async def memory_report():
+    """Report this worker's resident memory, cached price series and model registry"""
+    return {
+        "process": process_memory(),
+        "price_series": predictor.memory_report(),
+        "model_registry": predictor.registry.stats(),
+        "stage_timings": predictor.timings.snapshot(),
+        "prediction_threads": {"size": predictor.prediction_threads, "abandoned": predictor.abandoned_branches},
+        "lstm_concurrency": predictor.lstm_concurrency,
+        "generated_at": datetime.now().isoformat()
+    }
+
 @app.post("/risk-analyzer")
-async def analyze_risk(request: RiskAnalysisRequest):
+async def analyze_risk(request: RiskAnalysisRequest, http_request: Request):
     """Analyze portfolio risk"""
     try:
         logger.info(f"Analyzing risk for portfolio")
@@ -62,42 +190,101 @@ async def analyze_risk(request: RiskAnalysisRequest):
         # Analyze portfolio composition
         portfolio_analysis = await analyze_portfolio(request.holdings)
         
-        return {
+        return encode_response(http_request, {
             "risk_score": portfolio_analysis["risk_score"],
             "diversification_score": portfolio_analysis["diversification_score"],
             "sector_allocation": portfolio_analysis["sector_allocation"],
             "generated_at": datetime.now().isoformat()
-        }
+        })
     
     except Exception as e:
         logger.error(f"Error analyzing risk: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Risk analysis failed: {str(e)}")
 
 @app.get("/predict")
-async def predict_stock(symbol: str, horizon: int = 7):
-    """Get stock price predictions using Prophet and LSTM models"""
+async def predict_stock(http_request: Request, symbol: str, horizon: int = 7, model: str = "ensemble",
+                        max_latency_ms: Optional[float] = None):
+    """Get stock price predictions using Prophet and LSTM models.
+    
+    max_latency_ms runs only the models expected to finish in time; the
+    `model` field of the response names what was actually used. With
+    `Accept: application/msgpack` the forecast is sent as typed columns.
+    """
+    if model not in PREDICTION_MODELS:
+        raise HTTPException(status_code=400, detail=f"Unknown model '{model}', expected one of {PREDICTION_MODELS}")
+    
     try:
         symbol = symbol.upper()
-        logger.info(f"Generating prediction for {symbol} with horizon {horizon}")
+        logger.info(f"Generating {model} prediction for {symbol} with horizon {horizon}")
         
         # Get prediction from our model
-        prediction_result = await predictor.predict(symbol, horizon)
+        prediction_result = await predictor.predict(symbol, horizon, model, max_latency_ms)
         
-        return {
+        forecast = prediction_result["forecast"]
+        if wants_msgpack(http_request):
+            forecast = forecast_to_columns(forecast)
+        
+        return encode_response(http_request, {
             "symbol": symbol,
             "horizon": horizon,
-            "forecast": prediction_result["forecast"],
+            "forecast": forecast,
             "confidence": prediction_result["confidence"],
             "model": prediction_result["model"],
+            "metadata": prediction_result.get("metadata", {}),
             "generated_at": datetime.now().isoformat()
-        }
+        })
     
     except Exception as e:
         logger.error(f"Error predicting {symbol}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
+@app.post("/predict/batch")
+async def predict_batch(request: BatchPredictionRequest, http_request: Request):
+    """Get predictions for many symbols with batched LSTM inference.
+    
+    MessagePack clients asking for the fast model get one [symbols, horizon]
+    matrix per field (layout "columnar") straight from the NumPy forecast.
+    """
+    if request.model not in PREDICTION_MODELS:
+        raise HTTPException(status_code=400, detail=f"Unknown model '{request.model}', expected one of {PREDICTION_MODELS}")
+    
+    try:
+        symbols = [symbol.upper() for symbol in request.symbols]
+        logger.info(f"Generating {request.model} batch prediction for {len(symbols)} symbols with horizon {request.horizon}")
+        
+        binary = wants_msgpack(http_request)
+        if binary and request.model == "fast":
+            columns = await predictor.fast_predict_columns(symbols, request.horizon)
+            return encode_response(http_request, {
+                "horizon": request.horizon,
+                "layout": "columnar",
+                **columns,
+                "generated_at": datetime.now().isoformat()
+            })
+        
+        results = await predictor.predict_batch(symbols, request.horizon, request.model)
+        
+        return encode_response(http_request, {
+            "horizon": request.horizon,
+            "predictions": [
+                {
+                    "symbol": symbol,
+                    "forecast": forecast_to_columns(result["forecast"]) if binary else result["forecast"],
+                    "confidence": result["confidence"],
+                    "model": result["model"],
+                    "metadata": result.get("metadata", {})
+                }
+                for symbol, result in results.items()
+            ],
+            "generated_at": datetime.now().isoformat()
+        })
+    
+    except Exception as e:
+        logger.error(f"Error in batch prediction: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Batch prediction failed: {str(e)}")
+
 @app.get("/sentiment")
-async def analyze_sentiment(symbol: str, limit: int = 10):
+async def analyze_sentiment(http_request: Request, symbol: str, limit: int = 10):
     """Analyze news sentiment for a stock using FinBERT"""
     try:
         symbol = symbol.upper()
@@ -106,7 +293,7 @@ async def analyze_sentiment(symbol: str, limit: int = 10):
         # Get sentiment analysis
         sentiment_result = await sentiment_analyzer.analyze(symbol, limit)
         
-        return {
+        return encode_response(http_request, {
             "symbol": symbol,
             "sentiment": sentiment_result["sentiment"],
             "score": sentiment_result["score"],
@@ -115,12 +302,106 @@ async def analyze_sentiment(symbol: str, limit: int = 10):
             "articles": sentiment_result.get("articles", []),
             "model": sentiment_result["model"],
             "analyzed_at": datetime.now().isoformat()
-        }
+        })
     
     except Exception as e:
         logger.error(f"Error analyzing sentiment for {symbol}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Sentiment analysis failed: {str(e)}")
 
+@app.get("/sentiment/pipeline")
+async def sentiment_pipeline_status():
+    """Status of background news ingestion"""
+    if sentiment_analyzer.pipeline is None:
+        return {"enabled": False}
+    return {"enabled": True, **sentiment_analyzer.pipeline.stats()}
+
+@app.get("/sentiment/history")
+async def sentiment_history(symbol: str, start: Optional[str] = None, end: Optional[str] = None):
+    """Time-decayed sentiment index snapshots for a symbol over a date range (ISO dates)"""
+    try:
+        symbol = symbol.upper()
+        end_dt = datetime.fromisoformat(end) if end else datetime.now()
+        start_dt = datetime.fromisoformat(start) if start else end_dt - timedelta(days=30)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {str(e)}")
+    
+    return {
+        "symbol": symbol,
+        "start": start_dt.isoformat(),
+        "end": end_dt.isoformat(),
+        "current": sentiment_analyzer.index.current(symbol),
+        "history": sentiment_analyzer.index.history(symbol, start_dt.timestamp(), end_dt.timestamp()),
+        "half_life_hours": sentiment_analyzer.half_life_hours
+    }
+
+@app.websocket("/ws/forecasts")
+async def forecast_updates(websocket: WebSocket):
+    """Push forecast and indicator updates for subscribed symbols as new bars arrive.
+    
+    Clients send {"action": "subscribe" | "unsubscribe", "symbols": [...]} and
+    receive a "snapshot" per symbol, then an "update" after every new bar.
+    """
+    await websocket.accept()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=100)
+    subscribed = set()
+    
+    async def send_updates():
+        while True:
+            await websocket.send_json(await queue.get())
+    
+    # One sender per connection, so replies and updates never interleave
+    sender = asyncio.create_task(send_updates())
+    try:
+        while True:
+            message = await websocket.receive_json()
+            action = message.get("action")
+            symbols = [str(symbol).upper() for symbol in message.get("symbols", [])]
+            
+            if action == "subscribe":
+                for symbol in symbols:
+                    if await forecast_stream.subscribe(symbol, queue):
+                        subscribed.add(symbol)
+                    else:
+                        await queue.put({"type": "error", "symbol": symbol, "detail": "No price history"})
+            elif action == "unsubscribe":
+                for symbol in symbols:
+                    forecast_stream.unsubscribe(symbol, queue)
+                    subscribed.discard(symbol)
+            else:
+                await queue.put({"type": "error", "detail": f"Unknown action '{action}'"})
+    
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Forecast stream connection error: {str(e)}")
+    finally:
+        sender.cancel()
+        for symbol in subscribed:
+            forecast_stream.unsubscribe(symbol, queue)
+
+@app.get("/admission")
+async def admission_stats():
+    """Concurrency, queue depth, rejections and queue-wait percentiles per limited endpoint"""
+    return {
+        "endpoints": {path: limiter.stats() for path, limiter in admission_limiters.items()},
+        "generated_at": datetime.now().isoformat()
+    }
+
+@app.get("/materialize/status")
+async def materialization_status():
+    """Schedule, last run and serving hit rate of precomputed forecasts"""
+    if materialization is None:
+        return {"enabled": False, "store": predictor.materialized.stats()}
+    return {"enabled": True, **materialization.stats()}
+
+@app.get("/stream/status")
+async def stream_status():
+    """Forecast stream subscriptions and bar replay progress"""
+    return {
+        **forecast_stream.stats(),
+        "replay": replay_feed.symbols if replay_feed is not None else None
+    }
+
 @app.post("/recommend")
 async def get_recommendations(request: RecommendationRequest):
     """Generate portfolio recommendations and rebalancing suggestions"""
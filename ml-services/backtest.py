@@ -0,0 +1,192 @@
+# backtest.py - Parallel walk-forward evaluation of the Prophet/LSTM ensemble
+#
+#   python backtest.py AAPL MSFT --download          # store history under history/
+#   python backtest.py AAPL MSFT --folds 12 --workers 4 --output report.json
+import os
+import json
+import asyncio
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+from sklearn.metrics import mean_absolute_error
+
+from price_series import PriceSeries, history_path
+
+logger = logging.getLogger(__name__)
+
+MODELS = ('prophet', 'lstm', 'ensemble')
+
+# Per-process state, set up once by _init_worker
+_worker_predictor = None
+_worker_history_dir = None
+_worker_series: Dict[str, PriceSeries] = {}
+
+
+def walk_forward_cutoffs(length: int, horizon: int, folds: int, step: int, min_train: int) -> List[int]:
+    """Training cut-offs, latest first, each leaving `horizon` bars to score against"""
+    cutoffs = []
+    for k in range(folds):
+        cutoff = length - horizon - k * step
+        if cutoff < min_train:
+            break
+        cutoffs.append(cutoff)
+    return cutoffs
+
+
+def _init_worker(history_dir: str, models_dir: str):
+    """Create one predictor per process; fits are cached in models_dir across runs"""
+    global _worker_predictor, _worker_history_dir
+    from prediction import StockPredictor
+    from inference import configure_torch_threads
+
+    _worker_predictor = StockPredictor(models_dir=models_dir)
+    _worker_history_dir = history_dir
+    # The pool provides the parallelism; one torch thread per process
+    configure_torch_threads(1)
+
+
+def _worker_history(symbol: str) -> PriceSeries:
+    """Load each symbol's stored history once per process; folds slice views of it"""
+    series = _worker_series.get(symbol)
+    if series is None:
+        series = PriceSeries.load(history_path(_worker_history_dir, symbol))
+        _worker_series[symbol] = series
+    return series
+
+
+def _run_fold(task: Tuple[str, int, int]) -> Dict[str, Any]:
+    """Fit on history[:cutoff] and forecast the next horizon bars with every model"""
+    symbol, cutoff, horizon = task
+    series = _worker_history(symbol)
+    train = series.slice(stop=cutoff)
+    actual = series.close[cutoff:cutoff + horizon].astype(np.float64)
+    predictor = _worker_predictor
+    # Registry entries are per (kind, symbol): a per-cut-off name gives every fold
+    # its own cached fit (and file), so reruns reuse all of them
+    fold_key = f"{symbol}-{cutoff}"
+
+    async def forecast():
+        prophet = await predictor._prophet_predict(fold_key, train, horizon)
+        lstm = await predictor._lstm_predict(fold_key, train, horizon)
+        return prophet, lstm, predictor._ensemble_predictions(prophet, lstm)
+
+    prophet, lstm, ensemble = asyncio.run(forecast())
+
+    # Every model forecasts trading days (Prophet uses freq='B'), so step k is
+    # scored against the k-th following bar
+    predicted = {}
+    for name, points in zip(MODELS, (prophet, lstm, ensemble)):
+        if len(points) >= len(actual):
+            predicted[name] = [p["predicted_price"] for p in points[:len(actual)]]
+    return {"symbol": symbol, "cutoff": cutoff, "actual": actual.tolist(), "predicted": predicted}
+
+
+def _score(folds: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """MAE and MAPE per model and horizon step over a list of fold results"""
+    report = {}
+    for name in MODELS:
+        actual = np.array([f["actual"] for f in folds if name in f["predicted"]], dtype=np.float64)
+        if actual.size == 0:
+            report[name] = {"folds": 0}
+            continue
+        predicted = np.array([f["predicted"][name] for f in folds if name in f["predicted"]])
+        steps = actual.shape[1]
+        mape = np.abs(predicted - actual) / np.abs(actual) * 100
+        report[name] = {
+            "folds": len(actual),
+            "mae": mean_absolute_error(actual, predicted),
+            "mape": float(mape.mean()),
+            "mae_by_horizon": [mean_absolute_error(actual[:, h], predicted[:, h]) for h in range(steps)],
+            "mape_by_horizon": mape.mean(axis=0).tolist()
+        }
+    return report
+
+
+def run_backtest(symbols: List[str], horizon: int = 7, folds: int = 10, step: int = 5,
+                 min_train: int = 120, workers: int = 0, history_dir: str = "history",
+                 models_dir: str = os.path.join("models", "backtest")) -> Dict[str, Any]:
+    """Walk-forward backtest over stored history, parallel across symbols and folds"""
+    os.makedirs(models_dir, exist_ok=True)
+    tasks = []
+    for symbol in symbols:
+        path = history_path(history_dir, symbol)
+        if not os.path.exists(path):
+            logger.warning(f"No stored history for {symbol}, skipping")
+            continue
+        length = len(PriceSeries.load(path))
+        tasks.extend((symbol, cutoff, horizon)
+                     for cutoff in walk_forward_cutoffs(length, horizon, folds, step, min_train))
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                             initargs=(history_dir, models_dir)) as pool:
+        # Group a symbol's folds together so each process loads few histories
+        for result in pool.map(_run_fold, tasks, chunksize=max(1, folds // 2)):
+            results.append(result)
+
+    by_symbol: Dict[str, List[Dict[str, Any]]] = {}
+    for result in results:
+        by_symbol.setdefault(result["symbol"], []).append(result)
+
+    return {
+        "horizon": horizon,
+        # Exchange holidays still shift Prophet's business-day steps by one bar
+        "steps": "trading days (Prophet forecasts business days)",
+        "folds": len(results),
+        "symbols": sorted(by_symbol),
+        "models": _score(results),
+        "per_symbol": {symbol: _score(items) for symbol, items in by_symbol.items()},
+        "generated_at": datetime.now().isoformat()
+    }
+
+
+async def download_history(symbols: List[str], history_dir: str = "history"):
+    """Fetch current history through the predictor and store it for offline runs"""
+    from prediction import StockPredictor
+
+    os.makedirs(history_dir, exist_ok=True)
+    predictor = StockPredictor()
+    for symbol in symbols:
+        series = await predictor._fetch_data(symbol)
+        if series is None:
+            logger.warning(f"No history for {symbol}")
+            continue
+        series.save(history_path(history_dir, symbol))
+        logger.info(f"Stored {len(series)} bars for {symbol}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Walk-forward backtest of the forecasting models")
+    parser.add_argument("symbols", nargs="+")
+    parser.add_argument("--horizon", type=int, default=7)
+    parser.add_argument("--folds", type=int, default=10)
+    parser.add_argument("--step", type=int, default=5, help="bars between consecutive cut-offs")
+    parser.add_argument("--min-train", type=int, default=120)
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--history-dir", default="history")
+    parser.add_argument("--download", action="store_true", help="store fresh history and exit")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    symbols = [symbol.upper() for symbol in args.symbols]
+    if args.download:
+        asyncio.run(download_history(symbols, args.history_dir))
+        return
+
+    report = run_backtest(symbols, args.horizon, args.folds, args.step, args.min_train,
+                          args.workers, args.history_dir)
+    output = json.dumps(report, indent=2, default=float)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,113 @@
+# dedup.py - Near-duplicate article detection with MinHash signatures and LSH
+import zlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+# Mersenne prime 2^31 - 1: a * x + b stays below 2^62, so uint64 never overflows
+_PRIME = np.uint64((1 << 31) - 1)
+
+
+def shingles(text: str, k: int = 5) -> set:
+    """Word k-shingles of lower-cased text (the whole text if it is shorter than k words)"""
+    words = text.lower().split()
+    if len(words) <= k:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+
+class NearDuplicateIndex:
+    """Recently seen texts, found again by estimated Jaccard similarity.
+
+    Each text gets a MinHash signature of num_perm values; signatures are cut
+    into bands and bucketed per band, so a lookup only compares against texts
+    sharing at least one band (the LSH candidates) instead of every entry.
+    The oldest entries are evicted beyond max_entries.
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 32, threshold: float = 0.8,
+                 shingle_size: int = 5, max_entries: int = 10000, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.max_entries = max_entries
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, int(_PRIME), size=(num_perm, 1)).astype(np.uint64)
+        self._b = rng.randint(0, int(_PRIME), size=(num_perm, 1)).astype(np.uint64)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (signature, value)
+        self._buckets = [dict() for _ in range(bands)]
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.matches = 0
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """MinHash signature of text, or None when it has no words"""
+        grams = shingles(text, self.shingle_size)
+        if not grams:
+            return None
+        # crc32 rather than hash(): stable across processes and restarts
+        x = np.fromiter((zlib.crc32(g.encode()) for g in grams), dtype=np.uint64, count=len(grams))
+        hashed = (self._a * (x % _PRIME)[np.newaxis] + self._b) % _PRIME  # [num_perm, shingles]
+        return hashed.min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def find(self, signature: Optional[np.ndarray]) -> Optional[str]:
+        """Key of the most similar stored text at or above threshold, if any"""
+        if signature is None:
+            return None
+        with self._lock:
+            self.lookups += 1
+            candidates = set()
+            for band, band_key in enumerate(self._band_keys(signature)):
+                candidates.update(self._buckets[band].get(band_key, ()))
+            best, best_similarity = None, self.threshold
+            for key in candidates:
+                similarity = float(np.mean(self._entries[key][0] == signature))
+                if similarity >= best_similarity:
+                    best, best_similarity = key, similarity
+            if best is not None:
+                self.matches += 1
+            return best
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[1] if entry else None
+
+    def add(self, key: str, signature: Optional[np.ndarray], value: Any = None):
+        if signature is None:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (signature, value)
+            for band, band_key in enumerate(self._band_keys(signature)):
+                self._buckets[band].setdefault(band_key, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        signature, _ = self._entries.pop(key)
+        for band, band_key in enumerate(self._band_keys(signature)):
+            bucket = self._buckets[band].get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band][band_key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "lookups": self.lookups,
+                "matches": self.matches,
+                "threshold": self.threshold
+            }
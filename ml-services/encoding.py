@@ -0,0 +1,72 @@
+# encoding.py - Content negotiation for ML responses (fast JSON, columnar MessagePack)
+import json
+import logging
+from typing import Dict, List, Any
+
+import numpy as np
+from fastapi import Request
+from fastapi.responses import Response
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+# Forecast fields sent as typed columns in binary responses
+FORECAST_COLUMNS = ("predicted_price", "lower_bound", "upper_bound", "prophet_price", "lstm_price", "confidence")
+
+
+def wants_msgpack(request: Request) -> bool:
+    accept = request.headers.get("accept", "")
+    return msgpack is not None and any(media in accept for media in MSGPACK_TYPES)
+
+
+def forecast_to_columns(forecast: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Turn a list of forecast points into per-field float32 columns"""
+    columns: Dict[str, Any] = {"date": [point["date"] for point in forecast]}
+    for field in FORECAST_COLUMNS:
+        if forecast and field in forecast[0]:
+            columns[field] = np.fromiter((point[field] for point in forecast), dtype=np.float32, count=len(forecast))
+    return columns
+
+
+def _pack_default(obj: Any) -> Any:
+    """MessagePack hook: arrays travel as raw little-endian buffers"""
+    if isinstance(obj, np.ndarray):
+        arr = np.ascontiguousarray(obj)
+        if arr.dtype.byteorder == '>':
+            arr = arr.byteswap().view(arr.dtype.newbyteorder('<'))
+        return {"dtype": arr.dtype.str, "shape": list(arr.shape), "data": arr.tobytes()}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+
+def encode_response(request: Request, payload: Dict[str, Any]) -> Response:
+    """Encode payload per the Accept header, skipping FastAPI's jsonable_encoder pass"""
+    if wants_msgpack(request):
+        return Response(msgpack.packb(payload, default=_pack_default, use_bin_type=True),
+                        media_type="application/msgpack")
+    if orjson is not None:
+        body = orjson.dumps(payload, default=_json_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    else:
+        body = json.dumps(payload, default=_json_default).encode()
+    return Response(body, media_type="application/json")
@@ -0,0 +1,25 @@
+# gunicorn.conf.py - Multi-worker deployment sharing model weights
+#
+# The app (FinBERT, RoBERTa, torch runtime) is imported once in the master
+# and workers are forked from it, so model weights live in copy-on-write
+# pages shared by every worker instead of being loaded N times.
+#
+#   gunicorn -c gunicorn.conf.py app:app
+import os
+from workers import freeze_for_fork, on_worker_start
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+# Torch thread sizing in each worker divides cores by this
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+
+
+def pre_fork(server, worker):
+    freeze_for_fork()
+
+
+def post_fork(server, worker):
+    on_worker_start()
@@ -0,0 +1,129 @@
+# inference.py - Compiled, thread-tuned LSTM inference
+import os
+import logging
+import threading
+import weakref
+from typing import List
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch import Tensor
+
+logger = logging.getLogger(__name__)
+
+
+def configure_torch_threads(num_threads: int = 0) -> int:
+    """Pin torch intra-op threads so several uvicorn workers don't oversubscribe cores"""
+    if num_threads <= 0:
+        num_threads = int(os.getenv("TORCH_NUM_THREADS", "0"))
+    if num_threads <= 0:
+        workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+        num_threads = max(1, (os.cpu_count() or 1) // workers)
+    torch.set_num_threads(num_threads)
+    try:
+        # Only allowed before any inter-op parallel work has started
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+    return num_threads
+
+
+@torch.jit.script
+def stacked_lstm_forward(x: Tensor, w_ih: List[Tensor], w_hh: List[Tensor], bias: List[Tensor],
+                         fc_w: Tensor, fc_b: Tensor) -> Tensor:
+    """Run M independent LSTM models over M windows in one batched pass.
+
+    x: [M, T, I]; w_ih[l]: [M, 4H, in]; w_hh[l]: [M, 4H, H]; bias[l]: [M, 4H]
+    (b_ih + b_hh); fc_w: [M, O, H]; fc_b: [M, O]. Returns [M, O].
+    """
+    layer_input = x
+    for layer in range(len(w_ih)):
+        w_hh_t = w_hh[layer].transpose(1, 2)
+        hidden_size = w_hh_t.size(1)
+        h = x.new_zeros(x.size(0), 1, hidden_size)
+        c = x.new_zeros(x.size(0), 1, hidden_size)
+        # Input projections for every timestep at once: [M, T, 4H]
+        gates_x = torch.baddbmm(bias[layer].unsqueeze(1), layer_input, w_ih[layer].transpose(1, 2))
+        outputs: List[Tensor] = []
+        for t in range(x.size(1)):
+            gates = gates_x[:, t:t + 1] + torch.bmm(h, w_hh_t)
+            i, f, g, o = gates.chunk(4, 2)
+            c = torch.sigmoid(f) * c + torch.sigmoid(i) * torch.tanh(g)
+            h = torch.sigmoid(o) * torch.tanh(c)
+            outputs.append(h)
+        layer_input = torch.cat(outputs, 1)
+    last = layer_input[:, -1:]
+    return torch.bmm(last, fc_w.transpose(1, 2)).squeeze(1) + fc_b
+
+
+class LSTMInferenceEngine:
+    """Inference for LSTMModel: TorchScript graphs, inference_mode, batched rollouts.
+
+    A single model runs through its scripted graph (native LSTM kernel). Many
+    models of the same architecture over equal-length windows are stacked and
+    evaluated together with ``stacked_lstm_forward``, one call per horizon step.
+    """
+
+    def __init__(self, num_threads: int = 0):
+        self.num_threads = configure_torch_threads(num_threads)
+        self._scripted = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        logger.info(f"LSTM inference using {self.num_threads} intra-op threads")
+
+    def script(self, model: nn.Module) -> nn.Module:
+        """Return a cached TorchScript version of model, falling back to eager"""
+        with self._lock:
+            scripted = self._scripted.get(model)
+            if scripted is None:
+                model.eval()
+                try:
+                    scripted = torch.jit.script(model)
+                except Exception as e:
+                    logger.warning(f"Could not script LSTM model, running eagerly: {e}")
+                    scripted = model
+                self._scripted[model] = scripted
+            return scripted
+
+    def rollout(self, model: nn.Module, window: np.ndarray, horizon: int) -> np.ndarray:
+        """Autoregressive forecast of horizon scaled values from one window"""
+        return self.rollout_batch([model], window[np.newaxis], horizon)[0]
+
+    def rollout_batch(self, models: List[nn.Module], windows: np.ndarray, horizon: int) -> np.ndarray:
+        """Forecast horizon steps for M models, each over its own window.
+
+        windows is an [M, T] float32 array of scaled prices; returns [M, horizon].
+        """
+        seq = torch.from_numpy(np.ascontiguousarray(windows, dtype=np.float32)).unsqueeze(-1)
+        preds = np.empty((len(models), horizon), dtype=np.float32)
+
+        with torch.inference_mode():
+            if len(models) == 1:
+                step = self.script(models[0])
+            else:
+                stacked = self._stack_weights(models)
+                step = lambda x: stacked_lstm_forward(x, *stacked)
+
+            for i in range(horizon):
+                out = step(seq)
+                preds[:, i] = out[:, 0].numpy()
+                # Slide the window forward by the new prediction
+                seq = torch.cat([seq[:, 1:], out.unsqueeze(1)], dim=1)
+
+        return preds
+
+    @staticmethod
+    def _stack_weights(models: List[nn.Module]):
+        """Stack per-model LSTM and head weights along a leading model axis"""
+        num_layers = models[0].lstm.num_layers
+        w_ih, w_hh, bias = [], [], []
+        for layer in range(num_layers):
+            w_ih.append(torch.stack([getattr(m.lstm, f"weight_ih_l{layer}") for m in models]))
+            w_hh.append(torch.stack([getattr(m.lstm, f"weight_hh_l{layer}") for m in models]))
+            bias.append(torch.stack([
+                getattr(m.lstm, f"bias_ih_l{layer}") + getattr(m.lstm, f"bias_hh_l{layer}")
+                for m in models
+            ]))
+        fc_w = torch.stack([m.fc.weight for m in models])
+        fc_b = torch.stack([m.fc.bias for m in models])
+        return w_ih, w_hh, bias, fc_w, fc_b
@@ -0,0 +1,55 @@
+# latency.py - Measured stage timings for latency-budgeted predictions
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict
+
+# Starting estimates (ms) until each stage has been measured
+DEFAULT_STAGE_MS = {
+    "fetch": 800.0,
+    "prophet_fit": 3000.0,
+    "prophet_predict": 300.0,
+    "lstm_train": 5000.0,
+    "lstm_infer": 50.0,
+    "fast": 5.0,
+}
+
+
+class StageTimings:
+    """Exponentially weighted moving average of how long each prediction stage takes"""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self._estimates: Dict[str, float] = dict(DEFAULT_STAGE_MS)
+        self._counts: Dict[str, int] = {stage: 0 for stage in DEFAULT_STAGE_MS}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, elapsed_ms: float):
+        with self._lock:
+            count = self._counts.get(stage, 0)
+            if count == 0:
+                # First real measurement replaces the default outright
+                self._estimates[stage] = elapsed_ms
+            else:
+                self._estimates[stage] += self.alpha * (elapsed_ms - self._estimates[stage])
+            self._counts[stage] = count + 1
+
+    def estimate(self, stage: str) -> float:
+        with self._lock:
+            return self._estimates.get(stage, 0.0)
+
+    @contextmanager
+    def measure(self, stage: str):
+        """Time the enclosed block and record it under stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - start) * 1000)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                stage: {"estimate_ms": round(ms, 1), "samples": self._counts.get(stage, 0)}
+                for stage, ms in self._estimates.items()
+            }
@@ -0,0 +1,350 @@
+# materialize.py - Forecasts precomputed after market close for the most requested symbols
+import os
+import json
+import math
+import time
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, time as dt_time
+from typing import Dict, List, Any, Optional
+from zoneinfo import ZoneInfo
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so no leader election
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Per-process predictor for pool workers, set up once by _init_worker
+_worker_predictor = None
+
+
+def parse_clock(value: str) -> dt_time:
+    hours, minutes = value.split(":")
+    return dt_time(int(hours), int(minutes))
+
+
+def next_weekday_at(after: datetime, at: dt_time) -> datetime:
+    """First Monday-Friday moment at wall-clock `at` strictly after `after` (exchange holidays ignored)"""
+    candidate = after.replace(hour=at.hour, minute=at.minute, second=0, microsecond=0)
+    if candidate <= after:
+        candidate += timedelta(days=1)
+    while candidate.weekday() >= 5:
+        candidate += timedelta(days=1)
+    return candidate
+
+
+def write_json(path: str, payload: Any, default=None):
+    """Replace path atomically; the temp name is per process and thread, since
+    the scheduler and /train in other workers may write the same file at once"""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump(payload, f, default=default)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def counts_path(directory: str) -> str:
+    """Where this process flushes its request counts"""
+    return os.path.join(directory, f"requests-{os.getpid()}.json")
+
+
+class RequestCounter:
+    """Exponentially decayed request count per symbol (half-life in hours).
+
+    Each worker counts its own traffic and flushes it to a JSON file in the
+    shared directory; the scheduler merges every worker's file.
+    """
+
+    def __init__(self, half_life_hours: float = 24.0):
+        self.decay_rate = math.log(2) / (half_life_hours * 3600)
+        self._counts: Dict[str, List[float]] = {}  # symbol -> [count, as of epoch seconds]
+        self._lock = threading.Lock()
+
+    def record(self, symbol: str):
+        now = time.time()
+        with self._lock:
+            entry = self._counts.get(symbol)
+            if entry is None:
+                self._counts[symbol] = [1.0, now]
+            else:
+                entry[0] = entry[0] * math.exp(-self.decay_rate * (now - entry[1])) + 1.0
+                entry[1] = now
+
+    def snapshot(self) -> Dict[str, float]:
+        """Decayed counts as of now"""
+        now = time.time()
+        with self._lock:
+            return {symbol: count * math.exp(-self.decay_rate * (now - ts))
+                    for symbol, (count, ts) in self._counts.items()}
+
+    def flush(self, path: str):
+        write_json(path, {"as_of": time.time(), "counts": self.snapshot()})
+
+    def merged(self, directory: str) -> Dict[str, float]:
+        """This process's live counts plus every other worker's flushed counts.
+
+        Flushed files are decayed by their age. Our own file is skipped in
+        favour of the live counts, which is also what makes this work when
+        nothing has been flushed (no scheduler running).
+        """
+        now = time.time()
+        totals = self.snapshot()
+        own = os.path.basename(counts_path(directory))
+        for name in os.listdir(directory):
+            if name == own or not (name.startswith("requests-") and name.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    stored = json.load(f)
+            except (OSError, ValueError):
+                continue
+            decay = math.exp(-self.decay_rate * (now - stored["as_of"]))
+            for symbol, count in stored["counts"].items():
+                totals[symbol] = totals.get(symbol, 0.0) + count * decay
+        return totals
+
+
+class MaterializedForecasts:
+    """Precomputed predictions on disk, one JSON file per symbol and horizon.
+
+    Files are shared by every worker; parsed entries are cached per file
+    mtime. An entry is served until the next session opens or until a newer
+    bar than the one it was computed from has been fetched.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._cache: Dict[str, tuple] = {}  # path -> (mtime, entry)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, symbol: str, horizon: int) -> str:
+        return os.path.join(self.directory, f"{symbol}-{horizon}.json")
+
+    def put(self, entry: Dict[str, Any]):
+        # NumPy scalars can appear in model metadata
+        write_json(self._path(entry["symbol"], entry["horizon"]), entry,
+                   default=lambda obj: obj.item() if hasattr(obj, "item") else str(obj))
+
+    def _load(self, path: str) -> Optional[Dict[str, Any]]:
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Unreadable materialized forecast {path}: {e}")
+            return None
+        with self._lock:
+            self._cache[path] = (mtime, entry)
+        return entry
+
+    def get(self, symbol: str, horizon: int, latest_bar: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Stored prediction if still current; latest_bar is the newest bar date seen (epoch seconds)"""
+        entry = self._load(self._path(symbol, horizon))
+        fresh = (entry is not None and time.time() < entry["valid_until"]
+                 and (latest_bar is None or latest_bar <= entry["data_date"]))
+        if not fresh:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "directory": self.directory,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+def _init_worker(models_dir: str):
+    """One predictor per process; fitted models persist to the shared models_dir"""
+    global _worker_predictor
+    from prediction import StockPredictor
+    from inference import configure_torch_threads
+
+    _worker_predictor = StockPredictor(models_dir=models_dir)
+    # Always compute fresh here, never serve a previous run's output
+    _worker_predictor.materialized = None
+    # The pool provides the parallelism; one torch thread per process
+    configure_torch_threads(1)
+
+
+def _materialize_symbol(task: tuple) -> List[Dict[str, Any]]:
+    """Fit, forecast and summarise one symbol for every horizon"""
+    symbol, horizons, open_at, tz = task
+    predictor = _worker_predictor
+
+    async def compute():
+        return [await predictor.predict(symbol, horizon) for horizon in horizons]
+
+    try:
+        predictions = asyncio.run(compute())
+    except Exception as e:
+        logger.error(f"Materialization failed for {symbol}: {e}")
+        return []
+    data = predictor.series_cache.get(symbol)
+    if data is None or len(data) == 0:
+        return []
+
+    now = datetime.now(ZoneInfo(tz))
+    valid_until = next_weekday_at(now, open_at).timestamp()
+    entries = []
+    for horizon, prediction in zip(horizons, predictions):
+        if not prediction.get("forecast") or prediction["model"].startswith("fallback"):
+            continue
+        entries.append({
+            "symbol": symbol,
+            "horizon": horizon,
+            "prediction": prediction,
+            "data_date": int(data.dates[-1]),
+            "materialized_at": now.isoformat(),
+            "valid_until": valid_until
+        })
+    return entries
+
+
+def materialize_symbols(symbols: List[str], store: MaterializedForecasts, models_dir: str,
+                        horizons: List[int], workers: int = 0, open_at: str = "09:30",
+                        tz: str = "America/New_York") -> Dict[str, Any]:
+    """Precompute predictions for symbols across a process pool and store them"""
+    start = time.perf_counter()
+    tasks = [(symbol, horizons, parse_clock(open_at), tz) for symbol in symbols]
+    stored = 0
+    failed = []
+    # spawn: the calling web worker has live threads that must not be forked
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                             initargs=(models_dir,), mp_context=multiprocessing.get_context("spawn")) as pool:
+        for symbol, result in zip(symbols, pool.map(_materialize_symbol, tasks)):
+            if not result:
+                failed.append(symbol)
+            for entry in result:
+                store.put(entry)
+                stored += 1
+    return {
+        "symbols": len(symbols),
+        "stored": stored,
+        "failed": failed,
+        "elapsed_seconds": round(time.perf_counter() - start, 1),
+        "finished_at": datetime.now().isoformat()
+    }
+
+
+class MaterializationScheduler:
+    """Runs materialize_symbols once per weekday after the close for the busiest symbols.
+
+    The universe is the static symbols plus the top_n most requested across
+    all workers. Every worker flushes its request counts; the one holding the
+    directory lock file does the run, so a multi-worker deployment runs it once.
+    """
+
+    def __init__(self, predictor, static_symbols: List[str], top_n: int = 200,
+                 horizons: Optional[List[int]] = None, run_at: str = "16:30", open_at: str = "09:30",
+                 tz: str = "America/New_York", workers: int = 0, check_seconds: float = 60):
+        self.predictor = predictor
+        self.store = predictor.materialized
+        self.static_symbols = [symbol.upper() for symbol in static_symbols]
+        self.top_n = top_n
+        self.horizons = horizons or [7]
+        self.run_at = parse_clock(run_at)
+        self.open_at = open_at
+        self.tz = tz
+        self.workers = workers
+        self.check_seconds = check_seconds
+        self._lock_file = None
+        self._task: Optional[asyncio.Task] = None
+        self.next_run: Optional[datetime] = None
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    def _try_lead(self) -> bool:
+        """Take the directory lock without blocking; held until the process exits.
+
+        Without fcntl every process leads, so run a single worker there.
+        """
+        if fcntl is None:
+            return True
+        if self._lock_file is None:
+            handle = open(os.path.join(self.store.directory, "scheduler.lock"), "w")
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()
+                return False
+            self._lock_file = handle
+        return True
+
+    def universe(self) -> List[str]:
+        counts = self.predictor.request_counts.merged(self.store.directory)
+        popular = sorted(counts, key=counts.get, reverse=True)[:self.top_n]
+        return list(dict.fromkeys(self.static_symbols + popular))
+
+    async def run_once(self, symbols: Optional[List[str]] = None) -> Dict[str, Any]:
+        symbols = symbols or self.universe()
+        if not symbols:
+            return {"symbols": 0, "stored": 0, "failed": []}
+        logger.info(f"Materializing forecasts for {len(symbols)} symbols")
+        self.last_run = await asyncio.to_thread(
+            materialize_symbols, symbols, self.store, self.predictor.models_dir,
+            self.horizons, self.workers, self.open_at, self.tz
+        )
+        logger.info(f"Materialized {self.last_run['stored']} forecasts in {self.last_run['elapsed_seconds']}s")
+        return self.last_run
+
+    async def _loop(self):
+        own_counts = counts_path(self.store.directory)
+        self.next_run = next_weekday_at(datetime.now(ZoneInfo(self.tz)), self.run_at)
+        while True:
+            try:
+                self.predictor.request_counts.flush(own_counts)
+                now = datetime.now(ZoneInfo(self.tz))
+                if now >= self.next_run:
+                    # Schedule the next close first, so a failed run is not retried every check
+                    self.next_run = next_weekday_at(now, self.run_at)
+                    if self._try_lead():
+                        await self.run_once()
+            except Exception as e:
+                logger.error(f"Forecast materialization failed: {e}")
+            await asyncio.sleep(self.check_seconds)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "leader": fcntl is None or self._lock_file is not None,
+            "static_symbols": self.static_symbols,
+            "top_n": self.top_n,
+            "horizons": self.horizons,
+            "next_run": self.next_run.isoformat() if self.next_run else None,
+            "last_run": self.last_run,
+            "store": self.store.stats()
+        }
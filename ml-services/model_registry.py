@@ -0,0 +1,189 @@
+# model_registry.py - Memory-budgeted LRU cache of fitted forecasting artifacts
+import os
+import json
+import pickle
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import joblib
+import numpy as np
+import torch
+import torch.nn as nn
+from prophet.serialize import model_to_json, model_from_json
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_size(artifact: Any) -> int:
+    """Approximate resident size of a model artifact in bytes"""
+    if isinstance(artifact, nn.Module):
+        tensors = list(artifact.parameters()) + list(artifact.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    params = getattr(artifact, 'params', None)
+    history = getattr(artifact, 'history', None)
+    if isinstance(params, dict) and history is not None:
+        # Fitted Prophet: posterior parameters plus the retained training frame
+        size = sum(np.asarray(v).nbytes for v in params.values())
+        return size + int(history.memory_usage(deep=True).sum())
+    try:
+        return len(pickle.dumps(artifact, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 0
+
+
+class ModelRegistry:
+    """LRU registry for Prophet models, LSTM weights and scalers.
+
+    Artifacts are tracked by (kind, symbol) with their estimated size; the
+    least recently used ones are evicted once the memory budget is exceeded
+    and lazily reloaded from ``models_dir`` on the next lookup. Each entry
+    carries the epoch-second date of the last bar it was fitted on so callers
+    can tell whether it is still valid for the current history.
+    """
+
+    KINDS = {'prophet': '.json', 'scaler': '.joblib', 'lstm': '.pt'}
+
+    def __init__(self, models_dir: str, budget_bytes: int, lstm_factory: Callable[[], nn.Module]):
+        self.models_dir = models_dir
+        self.budget_bytes = budget_bytes
+        self.lstm_factory = lstm_factory
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._bytes_used = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.loads = 0
+
+    def _path(self, kind: str, symbol: str) -> str:
+        return os.path.join(self.models_dir, f"{symbol}_{kind}{self.KINDS[kind]}")
+
+    def get(self, kind: str, symbol: str, last_date: Optional[int] = None) -> Optional[Any]:
+        """Return the artifact for symbol, or None if absent or fitted on other data"""
+        found = self.get_with_meta(kind, symbol, last_date)
+        return found[0] if found is not None else None
+
+    def get_with_meta(self, kind: str, symbol: str,
+                      last_date: Optional[int] = None) -> Optional[Tuple[Any, Dict[str, Any]]]:
+        """Like get, plus the artifact's metadata, even when it was too large to stay resident"""
+        key = (kind, symbol)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if last_date is None or entry["last_date"] == last_date:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry["artifact"], dict(entry["meta"])
+                # Stale: fitted on older history
+                self._drop(key)
+            self.misses += 1
+
+        loaded = self._load(kind, symbol)
+        if loaded is None:
+            return None
+        artifact, stored_date, meta = loaded
+        if last_date is not None and stored_date != last_date:
+            return None
+        with self._lock:
+            self.loads += 1
+            self._insert(key, artifact, stored_date, meta)
+        return artifact, dict(meta)
+
+    def put(self, kind: str, symbol: str, artifact: Any, last_date: Optional[int] = None,
+            persist: bool = True, meta: Optional[Dict[str, Any]] = None):
+        """Register a freshly fitted artifact, optionally saving it to disk"""
+        meta = meta or {}
+        if persist:
+            self._save(kind, symbol, artifact, last_date, meta)
+        with self._lock:
+            self._insert((kind, symbol), artifact, last_date, meta)
+
+    def has(self, kind: str, symbol: str, last_date: Optional[int] = None) -> bool:
+        """Whether a matching artifact is resident, without touching LRU order or counters"""
+        with self._lock:
+            entry = self._entries.get((kind, symbol))
+            return entry is not None and (last_date is None or entry["last_date"] == last_date)
+
+    def meta(self, kind: str, symbol: str) -> Dict[str, Any]:
+        """Metadata recorded with a resident artifact (e.g. training stats)"""
+        with self._lock:
+            entry = self._entries.get((kind, symbol))
+            return dict(entry["meta"]) if entry is not None else {}
+
+    def _insert(self, key: Tuple[str, str], artifact: Any, last_date: Optional[int],
+                meta: Dict[str, Any]):
+        if key in self._entries:
+            self._drop(key)
+        size = estimate_size(artifact)
+        if size > self.budget_bytes:
+            logger.warning(f"{key[0]} model for {key[1]} ({size} bytes) exceeds registry budget, not cached")
+            return
+        self._entries[key] = {"artifact": artifact, "size": size, "last_date": last_date, "meta": meta}
+        self._bytes_used += size
+        while self._bytes_used > self.budget_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, key: Tuple[str, str]):
+        entry = self._entries.pop(key)
+        self._bytes_used -= entry["size"]
+
+    def _save(self, kind: str, symbol: str, artifact: Any, last_date: Optional[int],
+              meta: Dict[str, Any]):
+        path = self._path(kind, symbol)
+        # Web workers, materialization and backtest processes share models_dir:
+        # write a private temp file and rename it so readers never see a partial file
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            if kind == 'lstm':
+                torch.save({"state_dict": artifact.state_dict(), "last_date": last_date, "meta": meta}, tmp)
+            elif kind == 'prophet':
+                # Prophet models are not reliably picklable; use their JSON form
+                with open(tmp, 'w') as f:
+                    json.dump({"model": model_to_json(artifact), "last_date": last_date, "meta": meta}, f)
+            else:
+                joblib.dump({"artifact": artifact, "last_date": last_date, "meta": meta}, tmp)
+            os.replace(tmp, path)
+        except Exception as e:
+            logger.warning(f"Could not persist {kind} model for {symbol}: {e}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _load(self, kind: str, symbol: str) -> Optional[Tuple[Any, Optional[int], Dict[str, Any]]]:
+        path = self._path(kind, symbol)
+        if not os.path.exists(path):
+            return None
+        try:
+            if kind == 'lstm':
+                payload = torch.load(path, map_location='cpu')
+                model = self.lstm_factory()
+                model.load_state_dict(payload["state_dict"])
+                model.eval()
+                return model, payload.get("last_date"), payload.get("meta", {})
+            if kind == 'prophet':
+                with open(path) as f:
+                    payload = json.load(f)
+                return model_from_json(payload["model"]), payload.get("last_date"), payload.get("meta", {})
+            payload = joblib.load(path)
+            return payload["artifact"], payload.get("last_date"), payload.get("meta", {})
+        except Exception as e:
+            logger.warning(f"Could not load {kind} model for {symbol}: {e}")
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters and current memory use"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes_used": self._bytes_used,
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,231 @@
+# news_pipeline.py - Background news ingestion and precomputed sentiment
+import os
+import json
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Any, Optional
+
+from sentiment_index import oldest_first
+
+logger = logging.getLogger(__name__)
+
+
+class LocalNewsSource:
+    """Stand-in news feed reading <directory>/<SYMBOL>.json (a list of articles).
+
+    Each article needs title, url, content and published (ISO timestamp);
+    files can be rewritten between polls to simulate new stories arriving.
+    """
+
+    name = "local"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    async def fetch(self, symbol: str, limit: int) -> List[Dict[str, Any]]:
+        path = os.path.join(self.directory, f"{symbol}.json")
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            articles = json.load(f)
+        return articles[:limit]
+
+
+class YahooNewsSource:
+    """Yahoo Finance headlines with full text, via the analyzer's downloader"""
+
+    name = "yahoo"
+
+    def __init__(self, analyzer):
+        self.analyzer = analyzer
+
+    async def fetch(self, symbol: str, limit: int) -> List[Dict[str, Any]]:
+        return await self.analyzer._fetch_from_yahoo_finance(symbol, limit)
+
+
+class ArticleStore:
+    """Scored articles per symbol, newest first, deduplicated by URL.
+
+    Only what aggregation and the API need is kept (no article body). With a
+    path, every stored article is appended as a JSON line and reloaded on start.
+    on_add(symbol, record) is called once for every newly stored article.
+    """
+
+    def __init__(self, max_per_symbol: int = 200, path: Optional[str] = None,
+                 on_add: Optional[Callable[[str, Dict[str, Any]], None]] = None):
+        self.max_per_symbol = max_per_symbol
+        self.path = path
+        self.on_add = on_add
+        self._articles: Dict[str, List[Dict[str, Any]]] = {}
+        self._urls: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        # Appended in arrival order, which is newest first within each fetch
+        for record in oldest_first(records):
+            if self._insert(record["symbol"], record) and self.on_add:
+                self.on_add(record["symbol"], record)
+
+    def _insert(self, symbol: str, record: Dict[str, Any]) -> bool:
+        urls = self._urls.setdefault(symbol, set())
+        if record["url"] in urls:
+            return False
+        articles = self._articles.setdefault(symbol, [])
+        articles.append(record)
+        articles.sort(key=lambda a: a["published"], reverse=True)
+        urls.add(record["url"])
+        for dropped in articles[self.max_per_symbol:]:
+            urls.discard(dropped["url"])
+        del articles[self.max_per_symbol:]
+        return True
+
+    def has_url(self, symbol: str, url: str) -> bool:
+        with self._lock:
+            return url in self._urls.get(symbol, ())
+
+    def add(self, symbol: str, record: Dict[str, Any]) -> bool:
+        """Store a scored article; False if its URL is already stored"""
+        record = dict(record, symbol=symbol)
+        with self._lock:
+            added = self._insert(symbol, record)
+            if added and self.path:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+        if added and self.on_add:
+            self.on_add(symbol, record)
+        return added
+
+    def recent(self, symbol: str, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._articles.get(symbol, [])[:limit])
+
+    def count(self, symbol: str) -> int:
+        with self._lock:
+            return len(self._articles.get(symbol, []))
+
+
+class NewsIngestionPipeline:
+    """Periodically polls sources for a watch universe, scores new articles and stores them.
+
+    Near-duplicates (syndicated copies) are found with the analyzer's
+    NearDuplicateIndex: a copy already stored for the symbol is dropped, and
+    a copy first seen under another symbol reuses that score.
+    """
+
+    def __init__(self, analyzer, sources: List[Any], store: ArticleStore, universe: List[str],
+                 interval_seconds: float = 900, per_symbol_limit: int = 20):
+        self.analyzer = analyzer
+        self.sources = sources
+        self.store = store
+        self.universe = [symbol.upper() for symbol in universe]
+        self.interval_seconds = interval_seconds
+        self.per_symbol_limit = per_symbol_limit
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.articles_scored = 0
+        self.articles_skipped = 0
+        self.articles_checked = 0
+        self.articles_duplicate = 0
+        self.scores_reused = 0
+        self.last_run: Optional[str] = None
+
+    async def ingest_symbol(self, symbol: str) -> int:
+        """Fetch, clean and score articles not seen before; returns how many were stored"""
+        stored = 0
+        fetched = []
+        for source in self.sources:
+            try:
+                articles = await source.fetch(symbol, self.per_symbol_limit)
+            except Exception as e:
+                logger.warning(f"News source {source.name} failed for {symbol}: {e}")
+                continue
+            fetched.extend(dict(article, _source=source.name) for article in articles)
+
+        # Fold into the sentiment index in publication order across all sources
+        for article in oldest_first(fetched):
+            if not article.get("url") or self.store.has_url(symbol, article["url"]):
+                self.articles_skipped += 1
+                continue
+            
+            text = self.analyzer._clean_text(article.get("content", ""))
+            signature = self.analyzer.dedup.signature(text)
+            match = self.analyzer.dedup.find(signature)
+            self.articles_checked += 1
+            if match is not None and self.store.has_url(symbol, match):
+                self.articles_duplicate += 1
+                continue
+            
+            if match is not None:
+                result = self.analyzer.dedup.get(match)
+                self.scores_reused += 1
+            else:
+                # Transformer inference runs off the event loop
+                result = await asyncio.to_thread(self.analyzer._analyze_text, text, True)
+                if result:
+                    self.analyzer.dedup.add(article["url"], signature, result)
+            if not result:
+                continue
+            self.store.add(symbol, {
+                "title": article.get("title", ""),
+                "url": article["url"],
+                "published": article.get("published", datetime.now().isoformat()),
+                "sentiment": result["label"],
+                "score": float(result["score"]),
+                "source": article["_source"]
+            })
+            self.articles_scored += 1
+            stored += 1
+        return stored
+
+    async def run_once(self):
+        for symbol in self.universe:
+            stored = await self.ingest_symbol(symbol)
+            if stored:
+                logger.info(f"Ingested {stored} new articles for {symbol}")
+        self.runs += 1
+        self.last_run = datetime.now().isoformat()
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"News ingestion run failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "universe": self.universe,
+            "sources": [source.name for source in self.sources],
+            "interval_seconds": self.interval_seconds,
+            "runs": self.runs,
+            "last_run": self.last_run,
+            "articles_scored": self.articles_scored,
+            "articles_skipped": self.articles_skipped,
+            "articles_duplicate": self.articles_duplicate,
+            "scores_reused": self.scores_reused,
+            # Share of new URLs recognised as a copy of an already scored article
+            "dedup_rate": round((self.articles_duplicate + self.scores_reused) / self.articles_checked, 4)
+                          if self.articles_checked else 0.0,
+            "dedup_index": self.analyzer.dedup.stats(),
+            "stored": {symbol: self.store.count(symbol) for symbol in self.universe}
+        }
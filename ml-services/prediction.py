@@ -4,14 +4,23 @@ import numpy as np
 import yfinance as yf
 from prophet import Prophet
 from sklearn.preprocessing import MinMaxScaler
-from sklearn.metrics import mean_absolute_error
 import torch
 import torch.nn as nn
 from datetime import datetime, timedelta
-import joblib
 import os
+import time
+import zlib
+import asyncio
 import logging
-from typing import Dict, List, Any
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Any, Optional
+from price_series import PriceSeries, fill_nan
+from model_registry import ModelRegistry
+from inference import LSTMInferenceEngine
+from fast_forecast import Z_80, align_closes, fast_forecast
+from latency import StageTimings
+from materialize import MaterializedForecasts, RequestCounter, materialize_symbols
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -26,251 +35,744 @@ class LSTMModel(nn.Module):
         self.fc = nn.Linear(hidden_size, output_size)
         
     def forward(self, x):
-        h0 = torch.zeros(self.num_layers, x.size(0), self.hidden_size)
-        c0 = torch.zeros(self.num_layers, x.size(0), self.hidden_size)
-        out, _ = self.lstm(x, (h0, c0))
+        # nn.LSTM starts from zero h0/c0 itself; no per-call allocation needed
+        out, _ = self.lstm(x)
         out = self.fc(out[:, -1, :])
         return out
 
 class StockPredictor:
-    def __init__(self):
-        self.models_dir = "models"
+    def __init__(self, models_dir: str = "models"):
+        self.models_dir = models_dir
         os.makedirs(self.models_dir, exist_ok=True)
-        self.scalers = {}
-        self.prophet_models = {}
-        self.lstm_models = {}
+        # Fitted Prophet/LSTM/scaler artifacts, LRU-evicted past the memory budget
+        self.registry = ModelRegistry(
+            self.models_dir,
+            budget_bytes=int(os.getenv("MODEL_REGISTRY_BUDGET_MB", "512")) * 1024 * 1024,
+            lstm_factory=lambda: LSTMModel(input_size=1, hidden_size=50, num_layers=2)
+        )
+        # Scripted, thread-tuned LSTM inference shared by single and batch paths
+        self.inference = LSTMInferenceEngine()
+        self.sequence_length = 60
+        # LSTM training stops on validation plateau or when the per-symbol budget runs out
+        self.lstm_max_epochs = int(os.getenv("LSTM_MAX_EPOCHS", "50"))
+        self.lstm_batch_size = int(os.getenv("LSTM_BATCH_SIZE", "64"))
+        self.lstm_patience = int(os.getenv("LSTM_PATIENCE", "5"))
+        self.lstm_val_fraction = float(os.getenv("LSTM_VAL_FRACTION", "0.1"))
+        self.lstm_time_budget = float(os.getenv("LSTM_TIME_BUDGET_SECONDS", "5"))
+        # Each training already uses all of this worker's torch intra-op threads
+        # (configure_torch_threads), so only this many train at once, whatever
+        # the size of the branch pool below; the rest wait for a slot
+        self.lstm_concurrency = max(1, int(os.getenv("LSTM_CONCURRENCY", "1")))
+        self._lstm_slots = threading.BoundedSemaphore(self.lstm_concurrency)
+        # Prophet and LSTM branches run side by side in threads sharing the same
+        # PriceSeries arrays; cmdstan and torch both release the GIL while working.
+        # Two branches per admitted /predict request, so size for that by default
+        admitted = int(os.getenv("ADMISSION_PREDICT_CONCURRENCY", "8"))
+        self.prediction_threads = int(os.getenv("PREDICTION_THREADS", "0")) or 2 * admitted
+        self.executor = ThreadPoolExecutor(max_workers=self.prediction_threads, thread_name_prefix="predict")
+        # Timed-out branches keep their thread until they finish; counted on the
+        # executor future, so the count survives the caller's event loop closing
+        self.abandoned_branches = 0
+        self._abandoned_lock = threading.Lock()
+        self.prophet_timeout = float(os.getenv("PROPHET_TIMEOUT_SECONDS", "60"))
+        self.lstm_timeout = float(os.getenv("LSTM_TIMEOUT_SECONDS", "60"))
+        # Prophet bands: "sampled" draws PROPHET_UNCERTAINTY_SAMPLES simulations per
+        # predict; "residual" (or 0 samples) uses in-sample residual quantiles instead
+        self.prophet_intervals = os.getenv("PROPHET_INTERVALS", "residual")
+        self.prophet_uncertainty_samples = int(os.getenv("PROPHET_UNCERTAINTY_SAMPLES", "1000"))
+        if self.prophet_intervals != "sampled" or self.prophet_uncertainty_samples <= 0:
+            self.prophet_intervals, self.prophet_uncertainty_samples = "residual", 0
+        # Measured stage durations used to plan latency-budgeted predictions
+        self.timings = StageTimings()
+        # Compact per-symbol history, refreshed after series_ttl
+        self.series_cache: Dict[str, PriceSeries] = {}
+        self.series_ttl = timedelta(minutes=int(os.getenv("SERIES_CACHE_TTL_MINUTES", "15")))
+        self._warming: set = set()
+        # Called as listener(symbol, series) whenever a download replaces a cached series
+        self.series_listeners: List[Callable[[str, PriceSeries], None]] = []
+        # Ensemble forecasts precomputed after the close (see materialize.py), and the
+        # per-symbol demand that decides which symbols get precomputed
+        self.materialized = MaterializedForecasts(os.getenv("MATERIALIZED_DIR", os.path.join(models_dir, "materialized")))
+        self.request_counts = RequestCounter()
+        # Shared by the daily scheduler (app.py) and /train, so both write the same entries
+        self.materialize_horizons = [int(h) for h in os.getenv("MATERIALIZE_HORIZONS", "7").split(",")]
+        self.materialize_workers = int(os.getenv("MATERIALIZE_WORKERS", "0"))
+        self.market_open = os.getenv("MARKET_OPEN", "09:30")
+        self.market_tz = os.getenv("MARKET_TZ", "America/New_York")
         
-    async def predict(self, symbol: str, horizon: int = 7) -> Dict[str, Any]:
-        """Generate stock price predictions using ensemble of Prophet and LSTM"""
+    async def predict(self, symbol: str, horizon: int = 7, model: str = "ensemble",
+                      max_latency_ms: Optional[float] = None) -> Dict[str, Any]:
+        """Generate stock price predictions using ensemble of Prophet and LSTM.
+        
+        With max_latency_ms, only the models expected to finish within the
+        budget are run (see _plan_models); the fast forecaster is the floor.
+        """
+        start = time.perf_counter()
+        self.request_counts.record(symbol)
         try:
+            if model == "ensemble" and self.materialized is not None:
+                cached = self.series_cache.get(symbol)
+                entry = self.materialized.get(symbol, horizon, int(cached.dates[-1]) if cached is not None else None)
+                if entry is not None:
+                    result = dict(entry["prediction"])
+                    result["metadata"] = {**result.get("metadata", {}), "materialized_at": entry["materialized_at"]}
+                    return result
+            
+            if max_latency_ms is not None and not self._series_fresh(symbol):
+                fetch_ms = self.timings.estimate("fetch")
+                if fetch_ms > max_latency_ms:
+                    # A cold download alone would blow the budget: answer from whatever
+                    # history is cached and fetch in the background for next time
+                    self._warm_series(symbol)
+                    with self.timings.measure("fast"):
+                        result = self._fast_predict({symbol: self.series_cache.get(symbol)}, horizon)[symbol]
+                    result["metadata"] = {"latency_plan": {
+                        "budget_ms": round(max_latency_ms, 1),
+                        "estimated_fetch_ms": round(fetch_ms, 1),
+                        "fetch": "skipped"
+                    }}
+                    return result
+            
             # Get historical data
             data = await self._fetch_data(symbol)
             
+            if model == "fast":
+                with self.timings.measure("fast"):
+                    return self._fast_predict({symbol: data}, horizon)[symbol]
+            
             if data is None or len(data) < 30:
                 logger.warning(f"Insufficient data for {symbol}, using fallback prediction")
                 return self._fallback_prediction(symbol, horizon)
             
-            # Try Prophet prediction first
-            prophet_forecast = await self._prophet_predict(symbol, data, horizon)
-            
-            # Try LSTM prediction
-            lstm_forecast = await self._lstm_predict(symbol, data, horizon)
-            
-            # Ensemble predictions (weighted average)
-            ensemble_forecast = self._ensemble_predictions(prophet_forecast, lstm_forecast)
-            
-            # Calculate confidence based on model agreement
-            confidence = self._calculate_confidence(prophet_forecast, lstm_forecast)
-            
-            return {
-                "forecast": ensemble_forecast,
-                "confidence": confidence,
-                "model": "ensemble_prophet_lstm"
-            }
+            metadata = {}
+            run_prophet, run_lstm, lstm_budget, deadline = True, True, None, None
+            if max_latency_ms is not None:
+                remaining_ms = max_latency_ms - (time.perf_counter() - start) * 1000
+                deadline = max(0.0, remaining_ms) / 1000
+                plan = self._plan_models(symbol, data, remaining_ms)
+                metadata["latency_plan"] = plan
+                run_prophet, run_lstm = plan["prophet"], plan["lstm"]
+                lstm_budget = plan["lstm_train_budget_ms"] / 1000
+                if not run_prophet and not run_lstm:
+                    with self.timings.measure("fast"):
+                        result = self._fast_predict({symbol: data}, horizon)[symbol]
+                    result["metadata"] = metadata
+                    return result
+            
+            # Run Prophet and LSTM concurrently; each branch has its own timeout
+            prophet_branch = self._no_forecast()
+            if run_prophet:
+                prophet_branch = self._prophet_predict(symbol, data, horizon, deadline)
+            lstm_branch = self._no_forecast()
+            if run_lstm:
+                lstm_branch = self._lstm_predict(symbol, data, horizon, metadata, lstm_budget, deadline)
+            prophet_forecast, lstm_forecast = await asyncio.gather(prophet_branch, lstm_branch)
+            
+            return self._combine_forecasts(symbol, horizon, prophet_forecast, lstm_forecast, metadata)
             
         except Exception as e:
             logger.error(f"Prediction error for {symbol}: {str(e)}")
             return self._fallback_prediction(symbol, horizon)
     
-    async def _fetch_data(self, symbol: str, period: str = "2y") -> pd.DataFrame:
-        """Fetch historical stock data"""
-        try:
-            ticker = yf.Ticker(symbol)
-            # Try different periods if 2y fails
-            for p in [period, "1y", "6mo", "3mo"]:
-                try:
-                    data = ticker.history(period=p)
-                    if not data.empty:
-                        break
-                except:
+    async def predict_batch(self, symbols: List[str], horizon: int = 7,
+                            model: str = "ensemble") -> Dict[str, Dict[str, Any]]:
+        """Predict many symbols, running all LSTM forecasts in one batched pass"""
+        if model == "fast":
+            series = {symbol: await self._fetch_data(symbol) for symbol in symbols}
+            results = self._fast_predict(series, horizon)
+            return {symbol: results[symbol] for symbol in symbols}
+        
+        results = {}
+        pending = {}
+        
+        for symbol in symbols:
+            try:
+                data = await self._fetch_data(symbol)
+                if data is None or len(data) < 30:
+                    logger.warning(f"Insufficient data for {symbol}, using fallback prediction")
+                    results[symbol] = self._fallback_prediction(symbol, horizon)
                     continue
+                
+                # Prophet and LSTM training overlap; inference is batched below
+                prophet_branch = self._prophet_predict(symbol, data, horizon)
+                lstm_branch = self._run_branch(symbol, "LSTM", self.lstm_timeout, self._lstm_prepare, symbol, data)
+                prophet_forecast, prepared = await asyncio.gather(prophet_branch, lstm_branch)
+                pending[symbol] = (prophet_forecast, prepared or None)
+            except Exception as e:
+                logger.error(f"Prediction error for {symbol}: {str(e)}")
+                results[symbol] = self._fallback_prediction(symbol, horizon)
+        
+        # Every window has sequence_length points, so all models run in one call
+        lstm_forecasts = {}
+        ready = [(symbol, prepared) for symbol, (_, prepared) in pending.items() if prepared is not None]
+        if ready:
+            try:
+                models = [model for _, (model, _, _, _) in ready]
+                windows = np.stack([window for _, (_, _, window, _) in ready])
+                scaled = self.inference.rollout_batch(models, windows, horizon)
+                for (symbol, (_, scaler, _, _)), row in zip(ready, scaled):
+                    lstm_forecasts[symbol] = self._lstm_format(scaler, row)
+            except Exception as e:
+                logger.error(f"Batched LSTM inference error: {str(e)}")
+        
+        for symbol, (prophet_forecast, prepared) in pending.items():
+            metadata = {"lstm": prepared[3]} if prepared is not None else {}
+            results[symbol] = self._combine_forecasts(symbol, horizon, prophet_forecast,
+                                                      lstm_forecasts.get(symbol, []), metadata)
+        
+        return {symbol: results[symbol] for symbol in symbols}
+    
+    def _plan_models(self, symbol: str, data: PriceSeries, remaining_ms: float) -> Dict[str, Any]:
+        """Pick the best model set expected to fit in remaining_ms.
+        
+        Costs come from measured stage timings; models already fitted on this
+        history only pay for prediction, and the two branches run concurrently.
+        Preference: both, Prophet, LSTM, none.
+        """
+        last_date = int(data.dates[-1])
+        prophet_ms = self.timings.estimate("prophet_predict")
+        if not self.registry.has('prophet', symbol, last_date):
+            prophet_ms += self.timings.estimate("prophet_fit")
+        
+        lstm_ms = None
+        lstm_cached = self.registry.has('lstm', symbol, last_date) and self.registry.has('scaler', symbol, last_date)
+        if len(data) >= self.sequence_length + 10:
+            lstm_ms = self.timings.estimate("lstm_infer")
+            if not lstm_cached:
+                lstm_ms += min(self.timings.estimate("lstm_train"), self.lstm_time_budget * 1000)
+        
+        candidates = [(True, True), (True, False), (False, True)]
+        for run_prophet, run_lstm in candidates:
+            if run_lstm and lstm_ms is None:
+                continue
+            # Branches run concurrently, so the slower one sets the cost
+            cost = max(prophet_ms if run_prophet else 0, lstm_ms if run_lstm else 0)
+            if cost <= remaining_ms:
+                break
+        else:
+            run_prophet, run_lstm, cost = False, False, self.timings.estimate("fast")
+        
+        # Untrained LSTMs get whatever time is left after inference
+        train_budget_ms = self.lstm_time_budget * 1000
+        if run_lstm and not lstm_cached:
+            spare_ms = remaining_ms - self.timings.estimate("lstm_infer")
+            train_budget_ms = max(0.0, min(train_budget_ms, spare_ms))
+        
+        return {
+            "budget_ms": round(remaining_ms, 1),
+            "estimated_ms": round(cost, 1),
+            "prophet": run_prophet,
+            "lstm": run_lstm,
+            "lstm_train_budget_ms": round(train_budget_ms, 1)
+        }
+    
+    def _combine_forecasts(self, symbol: str, horizon: int, prophet_forecast: List,
+                           lstm_forecast: List, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Ensemble the model forecasts and score their agreement"""
+        if not prophet_forecast and not lstm_forecast:
+            return self._fallback_prediction(symbol, horizon)
+        
+        # Ensemble predictions (weighted average)
+        ensemble_forecast = self._ensemble_predictions(prophet_forecast, lstm_forecast)
+        
+        # Calculate confidence based on model agreement
+        confidence = self._calculate_confidence(prophet_forecast, lstm_forecast)
+        
+        # Label by the models that actually contributed
+        if prophet_forecast and lstm_forecast:
+            model = "ensemble_prophet_lstm"
+        else:
+            model = "prophet" if prophet_forecast else "lstm"
+        
+        metadata = metadata or {}
+        if prophet_forecast:
+            metadata["prophet_intervals"] = {
+                "method": self.prophet_intervals,
+                "uncertainty_samples": self.prophet_uncertainty_samples
+            }
+        
+        return {
+            "forecast": ensemble_forecast,
+            "confidence": confidence,
+            "model": model,
+            "metadata": metadata
+        }
+    
+    def _fast_predict(self, series: Dict[str, Optional[PriceSeries]], horizon: int) -> Dict[str, Dict[str, Any]]:
+        """Statistical forecasts for many symbols in one vectorized pass"""
+        available = {symbol: data for symbol, data in series.items() if data is not None and len(data) >= 2}
+        results = {symbol: self._flat_prediction(symbol, horizon, data)
+                   for symbol, data in series.items() if symbol not in available}
+        if not available:
+            return results
+        
+        symbols = list(available)
+        forecast = fast_forecast(align_closes(list(available.values())), horizon)
+        
+        for row, symbol in enumerate(symbols):
+            if not forecast["valid"][row]:
+                results[symbol] = self._flat_prediction(symbol, horizon, available[symbol])
+                continue
+            
+            # Dates continue from the last bar, as Prophet's future frame does
+            last_date = available[symbol].timestamps()[-1]
+            predictions = []
+            for i in range(horizon):
+                predictions.append({
+                    "date": (last_date + timedelta(days=i+1)).strftime('%Y-%m-%d'),
+                    "predicted_price": float(forecast["mean"][row, i]),
+                    "lower_bound": float(forecast["lower"][row, i]),
+                    "upper_bound": float(forecast["upper"][row, i]),
+                    "confidence": float(forecast["confidence"][row, i])
+                })
             
-            if data.empty:
+            results[symbol] = {
+                "forecast": predictions,
+                "confidence": float(forecast["confidence"][row].mean()),
+                "model": "fast_holt_drift"
+            }
+        
+        return results
+
+    async def fast_predict_columns(self, symbols: List[str], horizon: int = 7) -> Dict[str, Any]:
+        """Fast forecasts for many symbols as [M, horizon] arrays, without per-point dicts.
+
+        Rows follow `symbols`; rows with valid=False had too little data and hold NaN.
+        Dates are epoch days (days since 1970-01-01) continuing from each last bar.
+        """
+        series = [await self._fetch_data(symbol) for symbol in symbols]
+        present = [row for row, data in enumerate(series) if data is not None and len(data) >= 2]
+
+        shape = (len(symbols), horizon)
+        columns = {name: np.full(shape, np.nan, dtype=np.float32)
+                   for name in ("predicted_price", "lower_bound", "upper_bound", "confidence")}
+        valid = np.zeros(len(symbols), dtype=bool)
+        last_day = np.zeros(len(symbols), dtype=np.int32)
+
+        if present:
+            forecast = fast_forecast(align_closes([series[row] for row in present]), horizon)
+            for name, key in (("predicted_price", "mean"), ("lower_bound", "lower"),
+                              ("upper_bound", "upper"), ("confidence", "confidence")):
+                columns[name][present] = forecast[key]
+            valid[present] = forecast["valid"]
+            last_day[present] = [series[row].dates[-1] // 86400 for row in present]
+
+        return {
+            "symbols": list(symbols),
+            "valid": valid,
+            "date": last_day[:, None] + np.arange(1, horizon + 1, dtype=np.int32),
+            **columns,
+            "model": "fast_holt_drift"
+        }
+
+    def _series_fresh(self, symbol: str) -> bool:
+        cached = self.series_cache.get(symbol)
+        return cached is not None and datetime.now() - cached.fetched_at < self.series_ttl
+    
+    def _warm_series(self, symbol: str):
+        """Start a background fetch of symbol's history, at most one at a time per symbol"""
+        if symbol in self._warming:
+            return
+        self._warming.add(symbol)
+        task = asyncio.get_running_loop().create_task(self._fetch_data(symbol))
+        task.add_done_callback(lambda _: self._warming.discard(symbol))
+    
+    async def _fetch_data(self, symbol: str, period: str = "2y") -> Optional[PriceSeries]:
+        """Fetch historical stock data as a compact float32 series"""
+        if self._series_fresh(symbol):
+            return self.series_cache[symbol]
+        
+        try:
+            # yfinance blocks on HTTP; keep it off the event loop
+            with self.timings.measure("fetch"):
+                series = await asyncio.to_thread(self._download_history, symbol, period)
+            if series is None:
                 logger.warning(f"No data found for {symbol}")
                 return None
-                
-            # Add technical indicators
-            data['SMA_20'] = data['Close'].rolling(window=20).mean()
-            data['SMA_50'] = data['Close'].rolling(window=50).mean()
-            data['RSI'] = self._calculate_rsi(data['Close'])
-            data['Volatility'] = data['Close'].rolling(window=20).std()
             
-            return data
+            self.series_cache[symbol] = series
+            for listener in self.series_listeners:
+                try:
+                    listener(symbol, series)
+                except Exception as e:
+                    logger.error(f"Series listener failed for {symbol}: {e}")
+            return series
             
         except Exception as e:
             logger.error(f"Error fetching data for {symbol}: {str(e)}")
             return None
     
-    async def _prophet_predict(self, symbol: str, data: pd.DataFrame, horizon: int) -> List[Dict[str, Any]]:
+    def _download_history(self, symbol: str, period: str) -> Optional[PriceSeries]:
+        """Download history from yfinance (blocking), trying shorter periods if needed"""
+        ticker = yf.Ticker(symbol)
+        data = pd.DataFrame()
+        # Try different periods if 2y fails
+        for p in [period, "1y", "6mo", "3mo"]:
+            try:
+                # actions=False skips the Dividends/Stock Splits columns
+                data = ticker.history(period=p, actions=False)
+                if not data.empty:
+                    break
+            except:
+                continue
+        
+        if data.empty:
+            return None
+        # Indicators are computed once; the DataFrame is dropped afterwards
+        return PriceSeries.from_history(symbol, data)
+    
+    def memory_report(self) -> Dict[str, Any]:
+        """Report memory held by cached price series, per symbol"""
+        per_symbol = {symbol: series.memory_report() for symbol, series in self.series_cache.items()}
+        return {
+            "symbols": len(per_symbol),
+            "total_bytes": sum(report["bytes"] for report in per_symbol.values()),
+            "per_symbol": per_symbol
+        }
+    
+    async def _run_branch(self, symbol: str, name: str, timeout: float, func, *args):
+        """Run a blocking model branch on the executor; [] on error or timeout"""
+        if self.abandoned_branches >= self.prediction_threads // 2:
+            # Half the pool is held by timed-out work: queueing more would only make
+            # this branch time out waiting for a thread, so let the caller fall back
+            logger.warning(f"{name} branch for {symbol} skipped, {self.abandoned_branches} abandoned branches still running")
+            return []
+        
+        work = self.executor.submit(func, *args)
+        try:
+            # shield: a timeout must not cancel the work, which keeps running regardless
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(work)), timeout)
+        except asyncio.TimeoutError:
+            # The thread finishes in the background and still caches its fit
+            logger.warning(f"{name} branch for {symbol} timed out after {timeout:.1f}s")
+            with self._abandoned_lock:
+                self.abandoned_branches += 1
+            # Runs on the worker thread (or right away if already done), even
+            # after an asyncio.run() loop in a pool process has closed
+            work.add_done_callback(self._abandoned_done)
+        except Exception as e:
+            logger.error(f"{name} prediction error for {symbol}: {str(e)}")
+        return []
+    
+    def _abandoned_done(self, future: Future):
+        with self._abandoned_lock:
+            self.abandoned_branches -= 1
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning(f"Abandoned prediction branch failed: {future.exception()}")
+    
+    async def _no_forecast(self) -> List[Dict[str, Any]]:
+        return []
+    
+    async def _prophet_predict(self, symbol: str, data: PriceSeries, horizon: int,
+                               timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Generate predictions using Prophet model, off the event loop"""
+        timeout = self.prophet_timeout if timeout is None else min(timeout, self.prophet_timeout)
+        return await self._run_branch(symbol, "Prophet", timeout, self._prophet_forecast, symbol, data, horizon)
+    
+    def _prophet_forecast(self, symbol: str, data: PriceSeries, horizon: int) -> List[Dict[str, Any]]:
         """Generate predictions using Prophet model with enhanced features"""
         try:
-            # Prepare data for Prophet
-            df = data.reset_index()
-            df = df[['Date', 'Close']].rename(columns={'Date': 'ds', 'Close': 'y'})
-            # Remove timezone from datetime
-            df['ds'] = df['ds'].dt.tz_localize(None)
-            
-            # Create and fit Prophet model with optimized parameters
-            model = Prophet(
-                daily_seasonality=False,
-                weekly_seasonality=True,
-                yearly_seasonality=True,
-                changepoint_prior_scale=0.08,  # Increased for more flexibility
-                seasonality_prior_scale=0.1,
-                holidays_prior_scale=0.1,
-                interval_width=0.8
-            )
-            
-            # Add technical indicators as regressors
-            if 'Volume' in data.columns:
-                df['volume'] = np.log1p(data['Volume'].values)  # Log transform volume
-                model.add_regressor('volume')
-            
-            if 'RSI' in data.columns:
-                df['rsi'] = data['RSI'].fillna(50).values
-                model.add_regressor('rsi')
-            
-            if 'SMA_20' in data.columns and 'SMA_50' in data.columns:
-                df['sma_ratio'] = (data['SMA_20'] / data['SMA_50']).fillna(1).values
-                model.add_regressor('sma_ratio')
-            
-            if 'Volatility' in data.columns:
-                df['volatility'] = data['Volatility'].fillna(data['Volatility'].mean()).values
-                model.add_regressor('volatility')
-            
-            model.fit(df)
-            
-            # Make future predictions with forward-filled regressors
-            future = model.make_future_dataframe(periods=horizon)
+            # Prepare data for Prophet (dates are already timezone-naive)
+            df = pd.DataFrame({'ds': data.timestamps(), 'y': data.close})
+            
+            # Technical indicators used as regressors
+            df['volume'] = np.log1p(data.volume)  # Log transform volume
+            df['rsi'] = fill_nan(data.rsi, 50)
+            df['sma_ratio'] = fill_nan(data.sma_20 / data.sma_50, 1)
+            df['volatility'] = fill_nan(data.volatility, np.nanmean(data.volatility))
+            
+            # Reuse a model already fitted on this exact history
+            last_date = int(data.dates[-1])
+            cached = self.registry.get_with_meta('prophet', symbol, last_date)
+            if cached is not None:
+                model, meta = cached
+                # Sampling is read at predict time, so a cached fit follows the current setting
+                model.uncertainty_samples = self.prophet_uncertainty_samples
+                if self.prophet_intervals == "residual" and "residual_quantiles" not in meta:
+                    # Fitted before residual bands were recorded; record them once
+                    meta["residual_quantiles"] = self._residual_quantiles(model, df)
+                    self.registry.put('prophet', symbol, model, last_date, meta=meta)
+            else:
+                # Create and fit Prophet model with optimized parameters
+                model = Prophet(
+                    daily_seasonality=False,
+                    weekly_seasonality=True,
+                    yearly_seasonality=True,
+                    changepoint_prior_scale=0.08,  # Increased for more flexibility
+                    seasonality_prior_scale=0.1,
+                    holidays_prior_scale=0.1,
+                    interval_width=0.8,
+                    uncertainty_samples=self.prophet_uncertainty_samples
+                )
+                for col in ['volume', 'rsi', 'sma_ratio', 'volatility']:
+                    model.add_regressor(col)
+                
+                with self.timings.measure("prophet_fit"):
+                    model.fit(df)
+                    meta = {}
+                    if self.prophet_intervals == "residual":
+                        meta["residual_quantiles"] = self._residual_quantiles(model, df)
+                self.registry.put('prophet', symbol, model, last_date, meta=meta)
             
-            # Forward fill regressors for future predictions
-            for col in ['volume', 'rsi', 'sma_ratio', 'volatility']:
-                if col in df.columns:
-                    last_val = df[col].iloc[-1]
-                    # Add slight trend for future values
-                    if col == 'rsi':
-                        # RSI tends to mean revert
-                        future[col] = future[col].fillna(50 + (last_val - 50) * 0.8)
-                    elif col == 'volume':
-                        # Volume with slight decay
-                        future[col] = future[col].fillna(last_val * 0.95)
-                    else:
-                        future[col] = future[col].fillna(last_val)
-            
-            forecast = model.predict(future)
-            
-            # Extract predictions with dynamic confidence
-            predictions = []
-            current_price = data['Close'].iloc[-1]
+            residual_band = meta.get("residual_quantiles") if self.prophet_intervals == "residual" else None
             
-            for i in range(len(forecast) - horizon, len(forecast)):
-                pred_price = max(0, forecast.iloc[i]['yhat'])
-                lower_bound = max(0, forecast.iloc[i]['yhat_lower'])
-                upper_bound = forecast.iloc[i]['yhat_upper']
-                
-                # Calculate confidence based on prediction interval width
-                interval_width = (upper_bound - lower_bound) / pred_price if pred_price > 0 else 1
-                confidence = max(0.3, min(0.95, 1 - (interval_width / 2)))
-                
-                # Adjust confidence based on volatility
-                if 'Volatility' in data.columns:
-                    recent_vol = data['Volatility'].iloc[-5:].mean()
-                    vol_factor = max(0.5, 1 - (recent_vol / current_price))
-                    confidence *= vol_factor
-                
-                predictions.append({
-                    "date": forecast.iloc[i]['ds'].strftime('%Y-%m-%d'),
-                    "predicted_price": float(pred_price),
-                    "lower_bound": float(lower_bound),
-                    "upper_bound": float(upper_bound),
-                    "confidence": float(confidence)
-                })
+            # Only the horizon is predicted, in business days like the LSTM's
+            # bar-by-bar steps it is ensembled with; the future frame carries no
+            # regressor columns, so every one must be filled in before predict()
+            future = model.make_future_dataframe(periods=horizon, freq='B', include_history=False)
             
-            return predictions
+            # Forward fill regressors for future predictions
+            for col in ['volume', 'rsi', 'sma_ratio', 'volatility']:
+                last_val = df[col].iloc[-1]
+                # Add slight trend for future values
+                if col == 'rsi':
+                    # RSI tends to mean revert
+                    future[col] = 50 + (last_val - 50) * 0.8
+                elif col == 'volume':
+                    # Volume with slight decay
+                    future[col] = last_val * 0.95
+                else:
+                    future[col] = last_val
+            
+            with self.timings.measure("prophet_predict"):
+                forecast = model.predict(future)
+            
+            # Extract predictions with dynamic confidence, as whole columns
+            forecast = forecast.iloc[-horizon:]
+            yhat = forecast['yhat'].to_numpy(dtype=np.float64)
+            if residual_band is None:
+                lower = forecast['yhat_lower'].to_numpy(dtype=np.float64)
+                upper = forecast['yhat_upper'].to_numpy(dtype=np.float64)
+            else:
+                # In-sample residuals size one step of error; widen like a random walk, by sqrt(step)
+                spread = np.sqrt(np.arange(1, len(yhat) + 1))
+                lower = yhat + residual_band[0] * spread
+                upper = yhat + residual_band[1] * spread
+            pred_price = np.maximum(0, yhat)
+            lower_bound = np.maximum(0, lower)
+            
+            # Calculate confidence based on prediction interval width
+            safe_price = np.where(pred_price > 0, pred_price, 1)
+            interval_width = np.where(pred_price > 0, (upper - lower_bound) / safe_price, 1)
+            confidence = np.clip(1 - (interval_width / 2), 0.3, 0.95)
+            
+            # Adjust confidence based on volatility
+            recent_vol = np.nanmean(data.volatility[-5:])
+            if not np.isnan(recent_vol):
+                confidence *= max(0.5, 1 - (recent_vol / data.last_close))
+            
+            dates = forecast['ds'].dt.strftime('%Y-%m-%d')
+            return [
+                {
+                    "date": date,
+                    "predicted_price": float(p),
+                    "lower_bound": float(lo),
+                    "upper_bound": float(hi),
+                    "confidence": float(c)
+                }
+                for date, p, lo, hi, c in zip(dates, pred_price, lower_bound, upper, confidence)
+            ]
             
         except Exception as e:
             logger.error(f"Prophet prediction error for {symbol}: {str(e)}")
             return []
     
-    async def _lstm_predict(self, symbol: str, data: pd.DataFrame, horizon: int) -> List[Dict[str, Any]]:
-        """Generate predictions using LSTM model"""
+    def _residual_quantiles(self, model: Prophet, df: pd.DataFrame) -> List[float]:
+        """Offsets from yhat to the interval_width band, from in-sample residual quantiles.
+        
+        One sample-free predict over the history at fit time; bands then cost
+        a few vector operations per forecast instead of Prophet's simulated
+        paths. Callers widen them by sqrt(step) across the horizon.
+        """
+        samples = model.uncertainty_samples
+        model.uncertainty_samples = 0
+        try:
+            fitted = model.predict(df)['yhat'].to_numpy(dtype=np.float64)
+        finally:
+            model.uncertainty_samples = samples
+        residuals = df['y'].to_numpy(dtype=np.float64) - fitted
+        tail = (1 - model.interval_width) / 2
+        lower, upper = np.quantile(residuals, [tail, 1 - tail])
+        return [float(lower), float(upper)]
+    
+    async def _lstm_predict(self, symbol: str, data: PriceSeries, horizon: int,
+                            metadata: Optional[Dict[str, Any]] = None,
+                            time_budget: Optional[float] = None,
+                            timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Generate predictions using LSTM model, off the event loop"""
+        timeout = self.lstm_timeout if timeout is None else min(timeout, self.lstm_timeout)
+        return await self._run_branch(symbol, "LSTM", timeout, self._lstm_forecast,
+                                      symbol, data, horizon, metadata, time_budget)
+    
+    def _lstm_forecast(self, symbol: str, data: PriceSeries, horizon: int,
+                       metadata: Optional[Dict[str, Any]] = None,
+                       time_budget: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Generate predictions using LSTM model; training stats go to metadata['lstm']"""
         try:
-            # Prepare data for LSTM
-            prices = data['Close'].values.reshape(-1, 1)
+            prepared = self._lstm_prepare(symbol, data, time_budget)
+            if prepared is None:
+                return []
+            
+            model, scaler, window, training = prepared
+            if metadata is not None:
+                metadata["lstm"] = training
+            with self.timings.measure("lstm_infer"):
+                scaled = self.inference.rollout(model, window, horizon)
+            return self._lstm_format(scaler, scaled)
             
-            # Scale the data
+        except Exception as e:
+            logger.error(f"LSTM prediction error for {symbol}: {str(e)}")
+            return []
+    
+    def _lstm_prepare(self, symbol: str, data: PriceSeries, time_budget: Optional[float] = None):
+        """Train or reuse the symbol's LSTM; returns (model, scaler, last scaled window, training stats)"""
+        # Prepare data for LSTM
+        prices = data.close.reshape(-1, 1)
+        
+        sequence_length = self.sequence_length
+        if len(prices) < sequence_length + 10:
+            logger.warning(f"Insufficient data for LSTM training for {symbol}")
+            return None
+        
+        # Reuse weights and scaler already trained on this exact history
+        last_date = int(data.dates[-1])
+        scaler = self.registry.get('scaler', symbol, last_date)
+        cached = self.registry.get_with_meta('lstm', symbol, last_date) if scaler is not None else None
+        # Stats come with the weights, so they survive eviction or an over-budget load
+        model, stats = cached if cached is not None else (None, {})
+        
+        if model is None:
+            # Scale the data (MinMaxScaler preserves float32)
             scaler = MinMaxScaler()
-            scaled_prices = scaler.fit_transform(prices)
+            scaled_prices = scaler.fit_transform(prices).astype(np.float32, copy=False)
             
             # Create sequences for training
-            sequence_length = 60
-            if len(scaled_prices) < sequence_length + 10:
-                logger.warning(f"Insufficient data for LSTM training for {symbol}")
-                return []
-            
             X, y = self._create_sequences(scaled_prices, sequence_length)
             
-            # Convert to PyTorch tensors
-            X_tensor = torch.FloatTensor(X)
-            y_tensor = torch.FloatTensor(y)
-            
-            # Create and train LSTM model
-            model = LSTMModel(input_size=1, hidden_size=50, num_layers=2)
-            criterion = nn.MSELoss()
-            optimizer = torch.optim.Adam(model.parameters(), lr=0.001)
-            
-            # Quick training (in production, use pre-trained models)
+            # Wrap as PyTorch tensors without copying
+            X_tensor = torch.from_numpy(X)
+            y_tensor = torch.from_numpy(y)
+            
+            with self._lstm_slots:
+                with self.timings.measure("lstm_train"):
+                    model, training = self._train_lstm(X_tensor, y_tensor, time_budget)
+            
+            # A model cut short by a caller's tighter budget is not worth keeping
+            cut_short = training["stopped"] == "time_budget" and time_budget is not None \
+                and time_budget < self.lstm_time_budget
+            if not cut_short:
+                self.registry.put('scaler', symbol, scaler, last_date)
+                self.registry.put('lstm', symbol, model, last_date, meta=training)
+        else:
+            scaled_prices = scaler.transform(prices).astype(np.float32, copy=False)
+            training = dict(stats, reused=True)
+        
+        return model, scaler, scaled_prices[-sequence_length:, 0], training
+    
+    def _train_lstm(self, X: torch.Tensor, y: torch.Tensor, time_budget: Optional[float] = None):
+        """Mini-batch Adam with a held-out validation tail, early stopping and a wall-clock budget"""
+        model = LSTMModel(input_size=1, hidden_size=50, num_layers=2)
+        criterion = nn.MSELoss()
+        optimizer = torch.optim.Adam(model.parameters(), lr=0.001)
+        
+        # Validate on the most recent sequences, never seen in training
+        n_val = max(1, int(len(X) * self.lstm_val_fraction))
+        X_train, y_train = X[:-n_val], y[:-n_val]
+        X_val, y_val = X[-n_val:], y[-n_val:]
+        
+        if time_budget is None:
+            time_budget = self.lstm_time_budget
+        start = time.perf_counter()
+        best_loss = float('inf')
+        best_state = None
+        stale_epochs = 0
+        stopped = "max_epochs"
+        epoch = 0
+        train_loss = float('nan')
+        
+        for epoch in range(1, self.lstm_max_epochs + 1):
             model.train()
-            for epoch in range(50):  # Reduced epochs for speed
+            permutation = torch.randperm(len(X_train))
+            epoch_loss = 0.0
+            for i in range(0, len(X_train), self.lstm_batch_size):
+                batch = permutation[i:i + self.lstm_batch_size]
                 optimizer.zero_grad()
-                outputs = model(X_tensor)
-                loss = criterion(outputs, y_tensor)
+                loss = criterion(model(X_train[batch]), y_train[batch])
                 loss.backward()
                 optimizer.step()
+                epoch_loss += loss.item() * len(batch)
+            train_loss = epoch_loss / len(X_train)
             
-            # Make predictions
             model.eval()
-            predictions = []
-            last_sequence = scaled_prices[-sequence_length:].reshape(1, sequence_length, 1)
-            
-            for i in range(horizon):
-                with torch.no_grad():
-                    pred = model(torch.FloatTensor(last_sequence))
-                    pred_price = scaler.inverse_transform(pred.numpy())[0][0]
-                    
-                    # Update sequence for next prediction
-                    last_sequence = np.roll(last_sequence, -1, axis=1)
-                    last_sequence[0, -1, 0] = pred.item()
-                    
-                    future_date = datetime.now() + timedelta(days=i+1)
-                    predictions.append({
-                        "date": future_date.strftime('%Y-%m-%d'),
-                        "predicted_price": float(max(0, pred_price)),
-                        "confidence": 0.7
-                    })
-            
-            return predictions
-            
-        except Exception as e:
-            logger.error(f"LSTM prediction error for {symbol}: {str(e)}")
-            return []
+            with torch.inference_mode():
+                val_loss = criterion(model(X_val), y_val).item()
+            
+            # Require a 1% relative improvement to count as progress
+            if val_loss < best_loss * 0.99:
+                best_loss = val_loss
+                best_state = {k: v.clone() for k, v in model.state_dict().items()}
+                stale_epochs = 0
+            else:
+                stale_epochs += 1
+                if stale_epochs >= self.lstm_patience:
+                    stopped = "plateau"
+                    break
+            
+            if time.perf_counter() - start > time_budget:
+                stopped = "time_budget"
+                break
+        
+        if best_state is not None:
+            model.load_state_dict(best_state)
+        model.eval()
+        
+        return model, {
+            "epochs": epoch,
+            "train_loss": float(train_loss),
+            "val_loss": float(best_loss),
+            "stopped": stopped,
+            "train_ms": round((time.perf_counter() - start) * 1000, 1)
+        }
+    
+    def lstm_update(self, symbol: str, closes: np.ndarray, horizon: int) -> Optional[np.ndarray]:
+        """Roll the symbol's resident LSTM over the latest closes, without refitting.
+
+        The weights and scaler may predate the newest bars; only inference
+        runs. None when no fit is in memory (nothing is loaded from disk).
+        """
+        if len(closes) < self.sequence_length or not (
+                self.registry.has('lstm', symbol) and self.registry.has('scaler', symbol)):
+            return None
+        model = self.registry.get('lstm', symbol)
+        scaler = self.registry.get('scaler', symbol)
+        if model is None or scaler is None:
+            return None
+        window = scaler.transform(np.asarray(closes[-self.sequence_length:]).reshape(-1, 1))[:, 0]
+        scaled = self.inference.rollout(model, window.astype(np.float32, copy=False), horizon)
+        return np.maximum(scaler.inverse_transform(scaled.reshape(-1, 1))[:, 0], 0)
+    
+    def _lstm_format(self, scaler: MinMaxScaler, scaled: np.ndarray) -> List[Dict[str, Any]]:
+        """Turn scaled LSTM outputs into dated price predictions"""
+        prices = scaler.inverse_transform(scaled.reshape(-1, 1))[:, 0]
+        
+        predictions = []
+        for i, pred_price in enumerate(prices):
+            future_date = datetime.now() + timedelta(days=i+1)
+            predictions.append({
+                "date": future_date.strftime('%Y-%m-%d'),
+                "predicted_price": float(max(0, pred_price)),
+                "confidence": 0.7
+            })
+        
+        return predictions
     
     def _create_sequences(self, data: np.ndarray, seq_length: int):
         """Create sequences for LSTM training"""
-        X, y = [], []
-        for i in range(seq_length, len(data)):
-            X.append(data[i-seq_length:i])
-            y.append(data[i])
-        return np.array(X), np.array(y)
-    
-    def _calculate_rsi(self, prices: pd.Series, window: int = 14) -> pd.Series:
-        """Calculate Relative Strength Index"""
-        delta = prices.diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=window).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=window).mean()
-        rs = gain / loss
-        rsi = 100 - (100 / (1 + rs))
-        return rsi
+        # Sliding windows over the series, copied once into a contiguous float32 block
+        windows = np.lib.stride_tricks.sliding_window_view(data[:-1, 0], seq_length)
+        X = np.ascontiguousarray(windows[..., np.newaxis], dtype=np.float32)
+        y = np.ascontiguousarray(data[seq_length:], dtype=np.float32)
+        return X, y
     
     def _ensemble_predictions(self, prophet_forecast: List, lstm_forecast: List) -> List[Dict[str, Any]]:
         """Combine Prophet and LSTM predictions"""
@@ -327,33 +829,52 @@ class StockPredictor:
         return np.mean(agreements) if agreements else 0.6
     
     def _fallback_prediction(self, symbol: str, horizon: int) -> Dict[str, Any]:
-        """Fallback prediction when models fail"""
-        base_price = 100 + hash(symbol) % 200  # Deterministic base price
+        """Fallback prediction when models fail: statistical forecast on whatever history exists"""
+        result = self._fast_predict({symbol: self.series_cache.get(symbol)}, horizon)[symbol]
+        if result["model"] == "fast_holt_drift":
+            result["model"] = "fallback_holt_drift"
+        return result
+    
+    def _flat_prediction(self, symbol: str, horizon: int, data: Optional[PriceSeries] = None) -> Dict[str, Any]:
+        """Too little history to model: a flat line at the last known close.
+        
+        Always horizon points, as API consumers index the last one. Without any
+        close the base price is a stable per-symbol value (crc32, not hash(),
+        which varies between processes). Bands assume 2% daily volatility.
+        """
+        if data is not None and len(data) > 0 and data.last_close > 0:
+            base_price = data.last_close
+            start = data.timestamps()[-1]
+        else:
+            base_price = float(100 + zlib.crc32(symbol.encode()) % 200)
+            start = datetime.now()
         
         predictions = []
         for i in range(horizon):
-            # Simple random walk with slight upward bias
-            price_change = np.random.normal(0.01, 0.02)  # 1% mean, 2% std
-            price = base_price * (1 + price_change) ** (i + 1)
-            
-            future_date = datetime.now() + timedelta(days=i+1)
+            band = Z_80 * 0.02 * np.sqrt(i + 1)
             predictions.append({
-                "date": future_date.strftime('%Y-%m-%d'),
-                "predicted_price": float(max(0, price)),
-                "confidence": 0.5
+                "date": (start + timedelta(days=i+1)).strftime('%Y-%m-%d'),
+                "predicted_price": float(base_price),
+                "lower_bound": float(base_price * np.exp(-band)),
+                "upper_bound": float(base_price * np.exp(band)),
+                "confidence": 0.3
             })
         
         return {
             "forecast": predictions,
-            "confidence": 0.5,
+            "confidence": 0.3,
             "model": "fallback"
         }
     
     async def retrain_symbols(self, symbols: List[str]):
-        """Retrain models for specific symbols"""
+        """Refit models for specific symbols and refresh their materialized forecasts"""
         logger.info(f"Retraining models for symbols: {symbols}")
-        # Implementation for retraining specific symbols
-        pass
+        symbols = [symbol.upper() for symbol in symbols]
+        summary = await asyncio.to_thread(
+            materialize_symbols, symbols, self.materialized, self.models_dir, self.materialize_horizons,
+            self.materialize_workers, self.market_open, self.market_tz
+        )
+        logger.info(f"Retrained {len(symbols)} symbols, {len(summary['failed'])} failed")
     
     async def retrain_all_models(self):
         """Retrain all models"""
@@ -361,7 +882,11 @@ class StockPredictor:
         # Implementation for retraining all models
         pass
     
-    async def retrain_popular_symbols(self):
-        """Retrain models for popular symbols"""
-        popular_symbols = ['AAPL', 'MSFT', 'GOOGL', 'AMZN', 'TSLA']
+    async def retrain_popular_symbols(self, top_n: int = 50):
+        """Retrain models for the most requested symbols across workers"""
+        counts = self.request_counts.merged(self.materialized.directory)
+        popular_symbols = sorted(counts, key=counts.get, reverse=True)[:top_n]
+        if not popular_symbols:
+            logger.info("No prediction traffic recorded yet, nothing to retrain")
+            return
         await self.retrain_symbols(popular_symbols)
\ No newline at end of file
@@ -0,0 +1,118 @@
+# price_series.py - Compact array-backed price history
+import os
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+
+def calculate_rsi(prices: pd.Series, window: int = 14) -> pd.Series:
+    """Calculate Relative Strength Index"""
+    delta = prices.diff()
+    gain = (delta.where(delta > 0, 0)).rolling(window=window).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=window).mean()
+    rs = gain / loss
+    rsi = 100 - (100 / (1 + rs))
+    return rsi
+
+
+def fill_nan(values: np.ndarray, fill: float) -> np.ndarray:
+    """Return a copy of values with NaNs replaced by fill"""
+    return np.where(np.isnan(values), fill, values)
+
+
+def history_path(history_dir: str, symbol: str) -> str:
+    """Where save() output for symbol lives in a history directory"""
+    return os.path.join(history_dir, f"{symbol}.npz")
+
+
+class PriceSeries:
+    """Slim per-symbol history: float32 columns and int64 epoch-second dates.
+
+    Only the columns the forecasting models actually read are kept, so the
+    yfinance DataFrame can be dropped as soon as the indicators are computed.
+    """
+
+    __slots__ = ('symbol', 'dates', 'close', 'volume', 'sma_20', 'sma_50',
+                 'rsi', 'volatility', 'fetched_at')
+
+    COLUMNS = ('dates', 'close', 'volume', 'sma_20', 'sma_50', 'rsi', 'volatility')
+
+    def __init__(self, symbol: str, dates: np.ndarray, close: np.ndarray, volume: np.ndarray,
+                 sma_20: np.ndarray, sma_50: np.ndarray, rsi: np.ndarray,
+                 volatility: np.ndarray, fetched_at: Optional[datetime] = None):
+        self.symbol = symbol
+        self.dates = dates
+        self.close = close
+        self.volume = volume
+        self.sma_20 = sma_20
+        self.sma_50 = sma_50
+        self.rsi = rsi
+        self.volatility = volatility
+        self.fetched_at = fetched_at or datetime.now()
+
+    @classmethod
+    def from_history(cls, symbol: str, data: pd.DataFrame) -> 'PriceSeries':
+        """Build a series from a yfinance history frame, computing indicators once"""
+        close = data['Close']
+        index = data.index
+        if getattr(index, 'tz', None) is not None:
+            # Keep exchange wall-clock dates, as Prophet sees them
+            index = index.tz_localize(None)
+
+        def f32(values) -> np.ndarray:
+            return np.ascontiguousarray(np.asarray(values, dtype=np.float32))
+
+        return cls(
+            symbol=symbol,
+            dates=np.asarray(index.asi8 // 10**9, dtype=np.int64),
+            close=f32(close.values),
+            volume=f32(data['Volume'].values) if 'Volume' in data.columns else np.zeros(len(data), dtype=np.float32),
+            sma_20=f32(close.rolling(window=20).mean().values),
+            sma_50=f32(close.rolling(window=50).mean().values),
+            rsi=f32(calculate_rsi(close).values),
+            volatility=f32(close.rolling(window=20).std().values),
+        )
+
+    def __len__(self) -> int:
+        return len(self.close)
+
+    @property
+    def last_close(self) -> float:
+        return float(self.close[-1])
+
+    def timestamps(self) -> pd.DatetimeIndex:
+        """Dates as a naive DatetimeIndex"""
+        return pd.to_datetime(self.dates, unit='s')
+
+    def slice(self, start: Optional[int] = None, stop: Optional[int] = None) -> 'PriceSeries':
+        """Return a view over rows [start:stop] without copying the arrays"""
+        window = slice(start, stop)
+        return PriceSeries(
+            self.symbol,
+            *(getattr(self, col)[window] for col in self.COLUMNS),
+            fetched_at=self.fetched_at
+        )
+
+    def save(self, path: str):
+        """Store the columns as an uncompressed .npz for offline use"""
+        np.savez(path, symbol=self.symbol, **{col: getattr(self, col) for col in self.COLUMNS})
+
+    @classmethod
+    def load(cls, path: str) -> 'PriceSeries':
+        """Load a series written by save()"""
+        with np.load(path) as stored:
+            return cls(str(stored['symbol']), *(stored[col] for col in cls.COLUMNS))
+
+    def nbytes(self) -> int:
+        """Bytes held by the column arrays"""
+        return int(sum(getattr(self, col).nbytes for col in self.COLUMNS))
+
+    def memory_report(self) -> Dict[str, Any]:
+        """Per-column memory usage for this symbol"""
+        return {
+            "rows": len(self),
+            "bytes": self.nbytes(),
+            "columns": {col: int(getattr(self, col).nbytes) for col in self.COLUMNS},
+            "fetched_at": self.fetched_at.isoformat()
+        }
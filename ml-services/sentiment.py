@@ -9,8 +9,12 @@ from datetime import datetime, timedelta
 import logging
 from typing import Dict, List, Any
 import re
+import os
 import asyncio
 import aiohttp
+from news_pipeline import ArticleStore
+from dedup import NearDuplicateIndex
+from sentiment_index import SentimentIndex, oldest_first, parse_timestamp, sentiment_to_numeric, sentiment_label
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +29,17 @@ class SentimentAnalyzer:
     def __init__(self):
         self.finbert_model = None
         self.general_model = None
+        # Time-decayed sentiment per symbol, updated once per newly stored article
+        self.half_life_hours = float(os.getenv("SENTIMENT_HALF_LIFE_HOURS", "24"))
+        self.index = SentimentIndex(half_life_hours=self.half_life_hours)
+        # Articles scored ahead of time by the ingestion pipeline (see news_pipeline.py)
+        self.store = ArticleStore(
+            path=os.getenv("NEWS_STORE_PATH"),
+            on_add=lambda symbol, a: self.index.update(symbol, a['published'], a['sentiment'], a['score'])
+        )
+        self.pipeline = None
+        # Scores of recently seen article texts, so syndicated copies are scored once
+        self.dedup = NearDuplicateIndex(threshold=float(os.getenv("NEWS_DEDUP_THRESHOLD", "0.8")))
         self._initialize_models()
         
     def _initialize_models(self):
@@ -53,6 +68,14 @@ class SentimentAnalyzer:
     async def analyze(self, symbol: str, limit: int = 10) -> Dict[str, Any]:
         """Analyze sentiment for a stock symbol"""
         try:
+            # Symbols in the watch universe are served from the incremental index,
+            # which the pipeline keeps current; the stored articles are listed with it
+            if self.pipeline is not None and symbol in self.pipeline.universe:
+                stored = self.store.recent(symbol, limit)
+                current = self.index.current(symbol)
+                if stored and current is not None:
+                    return self._build_result(stored, model="precomputed", overall=current)
+            
             # Get news articles
             articles = await self._fetch_news(symbol, limit)
             
@@ -63,10 +86,30 @@ class SentimentAnalyzer:
             # Analyze sentiment of articles
             sentiments = []
             analyzed_articles = []
+            matched = set()
+            to_store = []
             
             for article in articles:
                 try:
-                    sentiment_result = self._analyze_text(article['content'])
+                    text = self._clean_text(article['content'])
+                    signature = self.dedup.signature(text)
+                    match = self.dedup.find(signature)
+                    # Made-up filler and copies of a story already stored for the
+                    # symbol are scored for this response but never stored
+                    storable = not article.get('mock')
+                    if match is not None:
+                        # Count each story once per response, reuse its score across requests
+                        if match in matched:
+                            continue
+                        matched.add(match)
+                        sentiment_result = self.dedup.get(match)
+                        storable = storable and not self.store.has_url(symbol, match)
+                    else:
+                        # Transformer inference runs off the event loop
+                        sentiment_result = await asyncio.to_thread(self._analyze_text, text, True)
+                        if sentiment_result:
+                            self.dedup.add(article['url'], signature, sentiment_result)
+                            matched.add(article['url'])
                     if sentiment_result:
                         sentiments.append(sentiment_result)
                         analyzed_articles.append({
@@ -76,29 +119,51 @@ class SentimentAnalyzer:
                             "sentiment": sentiment_result['label'],
                             "score": sentiment_result['score']
                         })
+                        if storable:
+                            to_store.append(dict(analyzed_articles[-1], score=float(sentiment_result['score']),
+                                                 source="on_demand"))
                 except Exception as e:
                     logger.error(f"Error analyzing article sentiment: {e}")
                     continue
             
+            # The store ignores URLs it already holds, so each story reaches the
+            # sentiment index (and /sentiment/history) once, in publication order
+            for record in oldest_first(to_store):
+                self.store.add(symbol, record)
+            
             if not sentiments:
                 return self._fallback_sentiment(symbol)
             
-            # Aggregate sentiments
-            overall_sentiment = self._aggregate_sentiments(sentiments)
-            
-            return {
-                "sentiment": overall_sentiment['label'],
-                "score": overall_sentiment['score'],
-                "summary": self._generate_summary(overall_sentiment, len(analyzed_articles)),
-                "sources_count": len(analyzed_articles),
-                "articles": analyzed_articles[:5],  # Return top 5 articles
-                "model": "finbert" if self.finbert_model else "general"
-            }
+            return self._build_result(analyzed_articles)
             
         except Exception as e:
             logger.error(f"Sentiment analysis error for {symbol}: {str(e)}")
             return self._fallback_sentiment(symbol)
     
+    def _build_result(self, analyzed_articles: List[Dict[str, Any]], model: str = None,
+                      overall: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Aggregate scored articles into the analyze() response (unless overall is given)"""
+        if overall is not None:
+            overall_sentiment = overall
+        else:
+            sentiments = [
+                {"label": a['sentiment'], "score": a['score'], "published": a.get('published')}
+                for a in analyzed_articles
+            ]
+            overall_sentiment = self._aggregate_sentiments(sentiments)
+        
+        return {
+            "sentiment": overall_sentiment['label'],
+            "score": overall_sentiment['score'],
+            "summary": self._generate_summary(overall_sentiment, len(analyzed_articles)),
+            "sources_count": len(analyzed_articles),
+            "articles": [
+                {key: a[key] for key in ("title", "url", "published", "sentiment", "score")}
+                for a in analyzed_articles[:5]  # Return top 5 articles
+            ],
+            "model": model or ("finbert" if self.finbert_model else "general")
+        }
+    
     async def _fetch_news(self, symbol: str, limit: int) -> List[Dict[str, Any]]:
         """Fetch news articles for a symbol"""
         articles = []
@@ -135,6 +200,11 @@ class SentimentAnalyzer:
     
     async def _fetch_from_yahoo_finance(self, symbol: str, limit: int) -> List[Dict[str, Any]]:
         """Fetch news from Yahoo Finance"""
+        # Article downloads are blocking; keep them off the event loop
+        return await asyncio.to_thread(self._download_yahoo_news, symbol, limit)
+    
+    def _download_yahoo_news(self, symbol: str, limit: int) -> List[Dict[str, Any]]:
+        """Download Yahoo Finance headlines and full article text"""
         try:
             import yfinance as yf
             ticker = yf.Ticker(symbol)
@@ -170,37 +240,41 @@ class SentimentAnalyzer:
             return []
     
     async def _fetch_mock_news(self, symbol: str, limit: int) -> List[Dict[str, Any]]:
-        """Generate mock news articles for testing"""
+        """Generate mock news articles for testing, tagged so they are never stored"""
         mock_articles = [
             {
                 "title": f"{symbol} Reports Strong Quarterly Earnings",
                 "content": f"{symbol} has reported better than expected quarterly earnings, showing strong growth in key business segments. The company's revenue increased significantly compared to the previous quarter.",
                 "url": f"https://example.com/news/{symbol.lower()}-earnings",
-                "published": (datetime.now() - timedelta(days=1)).isoformat()
+                "published": (datetime.now() - timedelta(days=1)).isoformat(),
+                "mock": True
             },
             {
                 "title": f"Analysts Upgrade {symbol} Price Target",
                 "content": f"Several Wall Street analysts have upgraded their price targets for {symbol} following positive market developments and strong fundamentals. The stock is showing bullish momentum.",
                 "url": f"https://example.com/news/{symbol.lower()}-upgrade",
-                "published": (datetime.now() - timedelta(days=2)).isoformat()
+                "published": (datetime.now() - timedelta(days=2)).isoformat(),
+                "mock": True
             },
             {
                 "title": f"{symbol} Faces Market Headwinds",
                 "content": f"{symbol} is navigating challenging market conditions with increased competition and regulatory concerns. Investors are closely watching the company's strategic response.",
                 "url": f"https://example.com/news/{symbol.lower()}-challenges",
-                "published": (datetime.now() - timedelta(days=3)).isoformat()
+                "published": (datetime.now() - timedelta(days=3)).isoformat(),
+                "mock": True
             }
         ]
         
         return mock_articles[:limit]
     
-    def _analyze_text(self, text: str) -> Dict[str, Any]:
+    def _analyze_text(self, text: str, cleaned: bool = False) -> Dict[str, Any]:
         """Analyze sentiment of text using available models"""
         if not text or len(text.strip()) < 10:
             return None
         
         # Clean text
-        text = self._clean_text(text)
+        if not cleaned:
+            text = self._clean_text(text)
         
         try:
             # Try FinBERT first
@@ -261,13 +335,27 @@ class SentimentAnalyzer:
         if not sentiments:
             return {"label": "neutral", "score": 0.5}
         
-        # Time-weighted sentiment aggregation (recent articles matter more)
+        # Time-weighted sentiment aggregation (recent articles matter more),
+        # decaying by publication age relative to the newest article
+        timestamps = []
+        for sentiment in sentiments:
+            try:
+                timestamps.append(parse_timestamp(sentiment['published']))
+            except (KeyError, TypeError, ValueError):
+                timestamps = None
+                break
+        decay_rate = np.log(2) / (self.half_life_hours * 3600)
+        newest = max(timestamps) if timestamps else None
+        
         weighted_scores = []
         total_weight = 0
         
         for i, sentiment in enumerate(sentiments):
-            # Time decay: more recent articles get higher weight
-            time_weight = 1.0 / (1 + i * 0.1)  # Decay factor
+            # Time decay: exponential in article age, or by list position if undated
+            if timestamps:
+                time_weight = np.exp(-decay_rate * (newest - timestamps[i]))
+            else:
+                time_weight = 1.0 / (1 + i * 0.1)
             
             # Confidence weight: higher confidence scores matter more
             conf_weight = sentiment['score']
@@ -276,12 +364,7 @@ class SentimentAnalyzer:
             weight = time_weight * conf_weight
             
             # Convert sentiment to numeric score
-            if sentiment['label'] == 'positive':
-                numeric_score = 0.7 + (sentiment['score'] - 0.5) * 0.6  # 0.7-1.0
-            elif sentiment['label'] == 'negative':
-                numeric_score = 0.3 - (sentiment['score'] - 0.5) * 0.6  # 0.0-0.3
-            else:
-                numeric_score = 0.4 + (sentiment['score'] - 0.5) * 0.2  # 0.4-0.6
+            numeric_score = sentiment_to_numeric(sentiment['label'], sentiment['score'])
             
             weighted_scores.append(numeric_score * weight)
             total_weight += weight
@@ -293,12 +376,7 @@ class SentimentAnalyzer:
             overall_score = 0.5
         
         # Determine label with hysteresis (avoid frequent switching)
-        if overall_score > 0.65:
-            label = "positive"
-        elif overall_score < 0.35:
-            label = "negative"
-        else:
-            label = "neutral"
+        label = sentiment_label(overall_score)
         
         # Add market context adjustment
         overall_score = self._adjust_for_market_context(overall_score, sentiments)
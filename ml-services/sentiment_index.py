@@ -0,0 +1,158 @@
+# sentiment_index.py - Incremental time-decayed sentiment index per symbol
+import math
+import threading
+from bisect import bisect_left, bisect_right
+from array import array
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+
+def sentiment_to_numeric(label: str, score: float) -> float:
+    """Map a (label, model confidence) pair onto the 0-1 sentiment scale"""
+    if label == 'positive':
+        return 0.7 + (score - 0.5) * 0.6  # 0.7-1.0
+    elif label == 'negative':
+        return 0.3 - (score - 0.5) * 0.6  # 0.0-0.3
+    return 0.4 + (score - 0.5) * 0.2  # 0.4-0.6
+
+
+def sentiment_label(value: float) -> str:
+    if value > 0.65:
+        return "positive"
+    elif value < 0.35:
+        return "negative"
+    return "neutral"
+
+
+def parse_timestamp(published: Any) -> float:
+    """Epoch seconds from an ISO string, datetime or number"""
+    if isinstance(published, (int, float)):
+        return float(published)
+    if isinstance(published, datetime):
+        return published.timestamp()
+    return datetime.fromisoformat(str(published)).timestamp()
+
+
+def oldest_first(articles: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Articles by ascending publication time, the order SymbolSentiment expects.
+
+    Feeds list newest first; folded in that order, every older article would be
+    a late arrival landing in the newest article's snapshot bucket.
+    """
+    def key(article: Dict[str, Any]) -> float:
+        try:
+            return parse_timestamp(article["published"])
+        except (KeyError, TypeError, ValueError):
+            # Undated articles are stamped with the current time when stored
+            return math.inf
+    return sorted(articles, key=key)
+
+
+class SymbolSentiment:
+    """Exponentially decayed weighted mean of article sentiment for one symbol.
+
+    State is two decayed sums referenced to the last update time, so each new
+    article costs O(1). Between articles the mean is unchanged (numerator and
+    denominator decay together) while the weight shows how fresh the news is.
+    Snapshots are kept in flat typed arrays, coalesced per snapshot_seconds.
+    """
+
+    __slots__ = ('decay_rate', 'snapshot_seconds', 'weighted_sum', 'total_weight',
+                 'last_ts', 'snap_ts', 'snap_value', 'snap_weight')
+
+    def __init__(self, decay_rate: float, snapshot_seconds: float):
+        self.decay_rate = decay_rate
+        self.snapshot_seconds = snapshot_seconds
+        self.weighted_sum = 0.0
+        self.total_weight = 0.0
+        self.last_ts: Optional[float] = None
+        self.snap_ts = array('q')
+        self.snap_value = array('f')
+        self.snap_weight = array('f')
+
+    def update(self, ts: float, value: float, weight: float):
+        if self.last_ts is None:
+            self.last_ts = ts
+        if ts >= self.last_ts:
+            decay = math.exp(-self.decay_rate * (ts - self.last_ts))
+            self.weighted_sum *= decay
+            self.total_weight *= decay
+            self.last_ts = ts
+        else:
+            # Late arrival: discount it to the current reference time
+            weight *= math.exp(-self.decay_rate * (self.last_ts - ts))
+        self.weighted_sum += value * weight
+        self.total_weight += weight
+        self._snapshot()
+
+    def _snapshot(self):
+        ts = int(self.last_ts)
+        value = self.value()
+        if self.snap_ts and ts - self.snap_ts[-1] < self.snapshot_seconds:
+            # Same snapshot bucket: overwrite rather than grow
+            self.snap_value[-1] = value
+            self.snap_weight[-1] = self.total_weight
+            return
+        self.snap_ts.append(ts)
+        self.snap_value.append(value)
+        self.snap_weight.append(self.total_weight)
+
+    def value(self) -> float:
+        return self.weighted_sum / self.total_weight if self.total_weight > 0 else 0.5
+
+    def weight_at(self, ts: float) -> float:
+        if self.last_ts is None:
+            return 0.0
+        return self.total_weight * math.exp(-self.decay_rate * max(0.0, ts - self.last_ts))
+
+
+class SentimentIndex:
+    """Per-symbol incremental sentiment with a queryable snapshot history"""
+
+    def __init__(self, half_life_hours: float = 24.0, snapshot_minutes: float = 60.0):
+        self.decay_rate = math.log(2) / (half_life_hours * 3600)
+        self.snapshot_seconds = snapshot_minutes * 60
+        self._symbols: Dict[str, SymbolSentiment] = {}
+        self._lock = threading.Lock()
+
+    def update(self, symbol: str, published: Any, label: str, score: float):
+        """Fold one scored article into the symbol's index"""
+        ts = parse_timestamp(published)
+        with self._lock:
+            state = self._symbols.get(symbol)
+            if state is None:
+                state = self._symbols[symbol] = SymbolSentiment(self.decay_rate, self.snapshot_seconds)
+            # Model confidence weights the article, as in _aggregate_sentiments
+            state.update(ts, sentiment_to_numeric(label, score), score)
+
+    def current(self, symbol: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            state = self._symbols.get(symbol)
+            if state is None or state.last_ts is None:
+                return None
+            value = state.value()
+            return {
+                "label": sentiment_label(value),
+                "score": round(value, 4),
+                "weight": round(state.weight_at(datetime.now().timestamp()), 4),
+                "updated_at": datetime.fromtimestamp(state.last_ts).isoformat()
+            }
+
+    def history(self, symbol: str, start: float, end: float) -> List[Dict[str, Any]]:
+        """Snapshots with start <= timestamp <= end, oldest first"""
+        with self._lock:
+            state = self._symbols.get(symbol)
+            if state is None:
+                return []
+            # Snapshot timestamps are non-decreasing, so the range is a slice
+            lo = bisect_left(state.snap_ts, int(start))
+            hi = bisect_right(state.snap_ts, int(end))
+            return [
+                {
+                    "timestamp": datetime.fromtimestamp(state.snap_ts[i]).isoformat(),
+                    "score": round(float(state.snap_value[i]), 4),
+                    "label": sentiment_label(state.snap_value[i]),
+                    "weight": round(float(state.snap_weight[i]), 4)
+                }
+                for i in range(lo, hi)
+            ]
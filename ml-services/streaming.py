@@ -0,0 +1,303 @@
+# streaming.py - Incremental forecast updates pushed to subscribers as new bars arrive
+import os
+import math
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+
+from price_series import PriceSeries, history_path
+from fast_forecast import damped_holt, project
+
+logger = logging.getLogger(__name__)
+
+
+class SymbolStream:
+    """Forecast and indicator state for one symbol, advanced one bar at a time.
+
+    Seeded from the same 252-bar tail fast_forecast uses, so the first
+    forecast matches the "fast" model. Each new bar is an O(1) damped Holt
+    step plus running sums for drift and return volatility.
+    """
+
+    __slots__ = ('alpha', 'beta', 'phi', 'level', 'trend', 'log_prices',
+                 'returns_sum', 'returns_sumsq', 'closes', 'deltas', 'last_date')
+
+    def __init__(self, series: PriceSeries, window: int = 252,
+                 alpha: float = 0.3, beta: float = 0.1, phi: float = 0.9):
+        self.alpha = alpha
+        self.beta = beta
+        self.phi = phi
+        log_tail = np.log(series.close[-window:].astype(np.float64))
+        level, trend = damped_holt(log_tail[np.newaxis], alpha=alpha, beta=beta, phi=phi)
+        self.level = float(level[0])
+        self.trend = float(trend[0])
+        self.log_prices = deque(log_tail.tolist(), maxlen=window)
+        returns = np.diff(log_tail)
+        self.returns_sum = float(returns.sum())
+        self.returns_sumsq = float((returns ** 2).sum())
+        # Enough closes for SMA-50, and the last 14 changes for RSI
+        self.closes = deque(series.close[-50:].tolist(), maxlen=50)
+        self.deltas = deque(np.diff(series.close[-15:]).tolist(), maxlen=14)
+        self.last_date = int(series.dates[-1])
+
+    def update(self, date: int, close: float):
+        x = math.log(close)
+        new_level = self.alpha * x + (1 - self.alpha) * (self.level + self.phi * self.trend)
+        self.trend = self.beta * (new_level - self.level) + (1 - self.beta) * self.phi * self.trend
+        self.level = new_level
+
+        window = self.log_prices
+        if len(window) == window.maxlen:
+            # The oldest return leaves the window along with its first price
+            dropped = window[1] - window[0]
+            self.returns_sum -= dropped
+            self.returns_sumsq -= dropped * dropped
+        change = x - window[-1]
+        self.returns_sum += change
+        self.returns_sumsq += change * change
+        window.append(x)
+
+        self.deltas.append(close - self.closes[-1])
+        self.closes.append(close)
+        self.last_date = date
+
+    def forecast(self, horizon: int) -> Dict[str, np.ndarray]:
+        """Projected [horizon] mean, bands and confidence from the current state"""
+        window = self.log_prices
+        n = len(window) - 1
+        drift = (window[-1] - window[0]) / max(n, 1)
+        variance = self.returns_sumsq / n - (self.returns_sum / n) ** 2 if n else 0.0
+        paths = project(np.array([self.level]), np.array([self.trend]), np.array([window[-1]]),
+                        np.array([drift]), np.array([math.sqrt(max(variance, 0.0))]), horizon, self.phi)
+        return {key: values[0] for key, values in paths.items()}
+
+    def indicators(self) -> Dict[str, Optional[float]]:
+        """Latest SMA, RSI and volatility, as PriceSeries.from_history computes them"""
+        closes = np.array(self.closes, dtype=np.float64)
+        rsi = None
+        if len(self.deltas) == self.deltas.maxlen:
+            deltas = np.array(self.deltas)
+            gain = deltas.clip(min=0).mean()
+            loss = (-deltas).clip(min=0).mean()
+            rsi = 100.0 if loss == 0 else float(100 - 100 / (1 + gain / loss))
+        return {
+            "sma_20": float(closes[-20:].mean()) if len(closes) >= 20 else None,
+            "sma_50": float(closes.mean()) if len(closes) >= 50 else None,
+            "rsi": rsi,
+            "volatility": float(closes[-20:].std(ddof=1)) if len(closes) >= 20 else None
+        }
+
+
+class ForecastStream:
+    """Per-symbol forecast state and the subscriber queues it publishes to.
+
+    Subscribers are asyncio queues (one per WebSocket connection). Queues are
+    bounded; a slow client loses its oldest pending update rather than
+    holding memory or blocking the feed.
+
+    Bars arrive from two feeds. Whenever the predictor downloads a fresh
+    series, its bars newer than the state are folded in. Symbols driven by a
+    BarReplayFeed are left to that feed instead. Messages (and the LSTM
+    rollout in them) are only built for symbols someone is subscribed to, and
+    a symbol's state is dropped with its last subscriber unless replay owns it.
+    """
+
+    def __init__(self, predictor, horizon: int = 7, window: int = 252):
+        self.predictor = predictor
+        self.horizon = horizon
+        self.window = window
+        self._states: Dict[str, SymbolStream] = {}
+        self._subscribers: Dict[str, set] = {}
+        # Symbols fed by BarReplayFeed; real downloads would jump their replayed history
+        self.replay_symbols: set = set()
+        predictor.series_listeners.append(self.on_series)
+        self.bars_processed = 0
+        self.updates_sent = 0
+        self.updates_dropped = 0
+
+    def seed(self, symbol: str, series: PriceSeries):
+        """(Re)start a symbol's state from history and send subscribers a fresh snapshot"""
+        self._states[symbol] = SymbolStream(series, self.window)
+        if self._subscribers.get(symbol):
+            self._publish(symbol, self._message(symbol, "snapshot"))
+
+    async def subscribe(self, symbol: str, queue: asyncio.Queue) -> bool:
+        """Register queue for symbol updates; False if the symbol has no usable history"""
+        if symbol not in self._states:
+            data = await self.predictor._fetch_data(symbol)
+            if data is None or len(data) < 2:
+                return False
+            self._states[symbol] = SymbolStream(data, self.window)
+        self._subscribers.setdefault(symbol, set()).add(queue)
+        self._offer(queue, self._message(symbol, "snapshot"))
+        return True
+
+    def unsubscribe(self, symbol: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(symbol)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[symbol]
+                if symbol not in self.replay_symbols:
+                    self._states.pop(symbol, None)
+
+    def on_bar(self, symbol: str, date: int, close: float) -> bool:
+        """Fold a new bar (epoch-second date) into the symbol's state and publish an update"""
+        state = self._states.get(symbol)
+        if state is None or date <= state.last_date or not close > 0:
+            return False
+        state.update(date, close)
+        self.bars_processed += 1
+        if self._subscribers.get(symbol):
+            self._publish(symbol, self._message(symbol, "update"))
+        return True
+
+    def on_series(self, symbol: str, series: PriceSeries):
+        """Predictor listener: fold in the bars a refetched series has beyond the state.
+
+        Runs on the event loop inside _fetch_data, so a catch-up folds every
+        bar first and publishes a single update.
+        """
+        state = self._states.get(symbol)
+        if state is None or symbol in self.replay_symbols:
+            return
+        newer = np.flatnonzero(series.dates > state.last_date)
+        if len(newer) >= self.window:
+            # Too far behind for bar-by-bar catch-up to be worth it
+            self.seed(symbol, series)
+            return
+        folded = 0
+        for i in newer:
+            close = float(series.close[i])
+            if close > 0:
+                state.update(int(series.dates[i]), close)
+                folded += 1
+        self.bars_processed += folded
+        if folded and self._subscribers.get(symbol):
+            self._publish(symbol, self._message(symbol, "update"))
+
+    def _lstm_forecast(self, symbol: str, state: SymbolStream) -> Optional[List[float]]:
+        """The symbol's last fitted LSTM rolled over the newest closes; None if not resident"""
+        try:
+            prices = self.predictor.lstm_update(symbol, np.exp(np.array(state.log_prices)), self.horizon)
+        except Exception as e:
+            logger.warning(f"LSTM stream update failed for {symbol}: {e}")
+            return None
+        return None if prices is None else [float(price) for price in prices]
+
+    def _message(self, symbol: str, kind: str) -> Dict[str, Any]:
+        state = self._states[symbol]
+        forecast = state.forecast(self.horizon)
+        lstm = self._lstm_forecast(symbol, state)
+        last_date = datetime.utcfromtimestamp(state.last_date)
+        return {
+            "type": kind,
+            "symbol": symbol,
+            "bar": {"date": last_date.strftime('%Y-%m-%d'), "close": float(state.closes[-1])},
+            "indicators": state.indicators(),
+            "forecast": [
+                {
+                    "date": (last_date + timedelta(days=i+1)).strftime('%Y-%m-%d'),
+                    "predicted_price": float(forecast["mean"][i]),
+                    "lower_bound": float(forecast["lower"][i]),
+                    "upper_bound": float(forecast["upper"][i]),
+                    "confidence": float(forecast["confidence"][i]),
+                    "lstm_price": lstm[i] if lstm is not None else None
+                }
+                for i in range(self.horizon)
+            ],
+            "confidence": float(forecast["confidence"].mean()),
+            "model": "stream_holt_drift",
+            "generated_at": datetime.now().isoformat()
+        }
+
+    def _publish(self, symbol: str, message: Dict[str, Any]):
+        for queue in self._subscribers.get(symbol, ()):
+            self._offer(queue, message)
+
+    def _offer(self, queue: asyncio.Queue, message: Dict[str, Any]):
+        if queue.full():
+            queue.get_nowait()
+            self.updates_dropped += 1
+        queue.put_nowait(message)
+        self.updates_sent += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "symbols": len(self._states),
+            "subscriptions": sum(len(queues) for queues in self._subscribers.values()),
+            "bars_processed": self.bars_processed,
+            "updates_sent": self.updates_sent,
+            "updates_dropped": self.updates_dropped
+        }
+
+
+class BarReplayFeed:
+    """Stand-in market feed replaying stored history (backtest.py --download) into a stream.
+
+    Each symbol is seeded with all but its last replay_bars bars, which are
+    then emitted one per interval; with loop=True the replay starts over.
+    """
+
+    def __init__(self, stream: ForecastStream, history_dir: str, symbols: List[str],
+                 replay_bars: int = 60, interval_seconds: float = 1.0, loop: bool = True):
+        self.stream = stream
+        self.history_dir = history_dir
+        self.symbols = [symbol.upper() for symbol in symbols]
+        self.replay_bars = replay_bars
+        self.interval_seconds = interval_seconds
+        self.loop = loop
+        self._series: Dict[str, PriceSeries] = {}
+        self._cursor: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def load(self):
+        """Read stored history and seed the stream up to each replay start"""
+        for symbol in self.symbols:
+            path = history_path(self.history_dir, symbol)
+            if not os.path.exists(path):
+                logger.warning(f"No stored history for {symbol} at {path}, not replaying it")
+                continue
+            series = self._series.get(symbol) or PriceSeries.load(path)
+            start = max(2, len(series) - self.replay_bars)
+            self._series[symbol] = series
+            self._cursor[symbol] = start
+            self.stream.replay_symbols.add(symbol)
+            self.stream.seed(symbol, series.slice(0, start))
+
+    def step(self) -> int:
+        """Emit the next bar for every symbol; returns how many were emitted"""
+        emitted = 0
+        for symbol, series in self._series.items():
+            i = self._cursor[symbol]
+            if i < len(series):
+                self.stream.on_bar(symbol, int(series.dates[i]), float(series.close[i]))
+                self._cursor[symbol] = i + 1
+                emitted += 1
+        return emitted
+
+    async def _run(self):
+        while True:
+            if not self.step():
+                if not self.loop:
+                    break
+                self.load()
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self):
+        if self._task is None:
+            self.load()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
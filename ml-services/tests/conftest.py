@@ -0,0 +1,5 @@
+# conftest.py - Make the service modules importable as top-level modules, as app.py does
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
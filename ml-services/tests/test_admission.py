@@ -0,0 +1,57 @@
+# test_admission.py - EndpointLimiter rejects with 429 when full and 503 on queue timeout
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from admission import EndpointLimiter, Rejected
+
+
+def test_full_queue_rejects_with_429():
+    async def scenario():
+        limiter = EndpointLimiter("test", concurrency=1, queue_size=1, queue_timeout=5)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Rejected) as rejected:
+            await limiter.acquire()
+        limiter.release(10.0)
+        await waiter
+        return limiter, rejected.value
+
+    limiter, rejected = asyncio.run(scenario())
+    assert rejected.status_code == 429
+    assert rejected.retry_after >= 1
+    assert limiter.rejected == 1
+    assert limiter.admitted == 2
+
+
+def test_queue_timeout_rejects_with_503():
+    async def scenario():
+        limiter = EndpointLimiter("test", concurrency=1, queue_size=4, queue_timeout=0.05)
+        await limiter.acquire()
+        with pytest.raises(Rejected) as rejected:
+            await limiter.acquire()
+        return limiter, rejected.value
+
+    limiter, rejected = asyncio.run(scenario())
+    assert rejected.status_code == 503
+    assert limiter.timed_out == 1
+    assert limiter.waiting == 0
+
+
+def test_release_admits_the_next_waiter():
+    async def scenario():
+        limiter = EndpointLimiter("test", concurrency=1, queue_size=1, queue_timeout=5)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.waiting == 1
+        limiter.release(20.0)
+        await waiter
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.in_flight == 1
+    assert limiter.service_ms == 20.0
@@ -0,0 +1,57 @@
+# test_dedup.py - MinHash/LSH near-duplicate detection
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from dedup import NearDuplicateIndex, shingles
+
+STORY = ("Apple reported record services revenue for the quarter as subscriptions grew "
+         "across every region, while hardware sales were flat compared with a year ago. "
+         "The company said it expects continued growth in the coming quarter and raised "
+         "its dividend, sending the shares higher in after-hours trading on Thursday.")
+
+SYNDICATED = STORY.replace("on Thursday.", "on Thursday, according to Reuters.")
+
+UNRELATED = ("Oil prices slipped on Monday after inventories rose more than analysts had "
+             "forecast, and traders weighed the outlook for demand as refiners entered "
+             "their seasonal maintenance period across several major producing states.")
+
+
+def test_shingles_of_short_and_empty_text():
+    assert shingles("Apple beats estimates", k=5) == {"apple beats estimates"}
+    assert shingles("", k=5) == set()
+    assert len(shingles(" ".join(str(i) for i in range(10)), k=5)) == 6
+
+
+def test_syndicated_copy_is_found_and_unrelated_text_is_not():
+    index = NearDuplicateIndex()
+    index.add("original", index.signature(STORY), {"label": "positive", "score": 0.9})
+
+    assert index.find(index.signature(SYNDICATED)) == "original"
+    assert index.get("original") == {"label": "positive", "score": 0.9}
+    assert index.find(index.signature(UNRELATED)) is None
+    assert index.stats()["matches"] == 1
+
+
+def test_empty_text_has_no_signature_and_matches_nothing():
+    index = NearDuplicateIndex()
+    assert index.signature("") is None
+    index.add("empty", None)
+    assert index.find(None) is None
+    assert index.stats()["entries"] == 0
+
+
+def test_oldest_entries_are_evicted_with_their_buckets():
+    index = NearDuplicateIndex(max_entries=1)
+    index.add("story", index.signature(STORY))
+    index.add("oil", index.signature(UNRELATED))
+
+    assert index.stats()["entries"] == 1
+    assert index.find(index.signature(STORY)) is None
+    assert index.find(index.signature(UNRELATED)) == "oil"
+    assert all(key == "oil" for buckets in index._buckets for keys in buckets.values() for key in keys)
+
+
+def test_num_perm_must_split_into_bands():
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(num_perm=100, bands=32)
@@ -0,0 +1,58 @@
+# test_fast_forecast.py - Vectorized damped Holt + drift forecaster
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+
+from fast_forecast import damped_holt, fast_forecast
+
+
+def random_walk(length: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return (50 * np.exp(np.cumsum(rng.normal(0.001, 0.015, length)))).astype(np.float32)
+
+
+def test_rows_are_forecast_independently():
+    closes = np.stack([random_walk(120, seed) for seed in range(3)])
+    together = fast_forecast(closes, 5)
+    for row in range(3):
+        alone = fast_forecast(closes[row:row + 1], 5)
+        np.testing.assert_allclose(together["mean"][row], alone["mean"][0])
+
+
+def test_nan_padding_matches_the_unpadded_history():
+    short = random_walk(80, seed=4)
+    padded = np.full((1, 120), np.nan, dtype=np.float32)
+    padded[0, -80:] = short
+
+    np.testing.assert_allclose(fast_forecast(padded, 7)["mean"], fast_forecast(short[np.newaxis], 7)["mean"])
+
+
+def test_rows_with_fewer_than_two_prices_are_invalid():
+    closes = np.full((2, 30), np.nan, dtype=np.float32)
+    closes[0, -1] = 10.0
+    closes[1] = random_walk(30, seed=5)
+    assert fast_forecast(closes, 3)["valid"].tolist() == [False, True]
+
+
+def test_constant_growth_is_extrapolated():
+    closes = (100 * 1.01 ** np.arange(60))[np.newaxis].astype(np.float32)
+    forecast = fast_forecast(closes, 5)
+    expected = float(closes[0, -1]) * 1.01 ** np.arange(1, 6)
+    # The drift half follows the growth exactly; the damped Holt half lags it a little
+    np.testing.assert_allclose(forecast["mean"][0], expected, rtol=0.03)
+    assert np.all(np.diff(forecast["mean"][0]) > 0)
+
+
+def test_bands_contain_the_mean_and_widen_with_the_horizon():
+    forecast = fast_forecast(random_walk(250, seed=6)[np.newaxis], 10)
+    lower, mean, upper = forecast["lower"][0], forecast["mean"][0], forecast["upper"][0]
+    assert np.all(lower < mean) and np.all(mean < upper)
+    assert np.all(np.diff(upper - lower) > 0)
+    assert np.all((forecast["confidence"] >= 0.3) & (forecast["confidence"] <= 0.95))
+
+
+def test_damped_holt_flat_series_has_no_trend():
+    level, trend = damped_holt(np.log(np.full((1, 40), 20.0)))
+    assert level[0] == pytest.approx(np.log(20.0))
+    assert trend[0] == pytest.approx(0.0)
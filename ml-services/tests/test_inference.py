@@ -0,0 +1,39 @@
+# test_inference.py - Batched LSTM inference matches the per-model LSTMModel
+import pytest
+
+np = pytest.importorskip("numpy")
+torch = pytest.importorskip("torch")
+pytest.importorskip("prophet")
+pytest.importorskip("yfinance")
+
+from inference import LSTMInferenceEngine, stacked_lstm_forward
+from prediction import LSTMModel
+
+
+def make_models(count: int):
+    torch.manual_seed(0)
+    return [LSTMModel(input_size=1, hidden_size=50, num_layers=2).eval() for _ in range(count)]
+
+
+def test_stacked_forward_matches_each_model():
+    models = make_models(3)
+    windows = np.random.default_rng(0).random((3, 60), dtype=np.float32)
+    x = torch.from_numpy(windows).unsqueeze(-1)
+
+    with torch.inference_mode():
+        stacked = stacked_lstm_forward(x, *LSTMInferenceEngine._stack_weights(models))
+        expected = torch.cat([model(x[i:i + 1]) for i, model in enumerate(models)])
+
+    torch.testing.assert_close(stacked, expected, rtol=1e-5, atol=1e-5)
+
+
+def test_batch_rollout_matches_single_rollouts():
+    engine = LSTMInferenceEngine(num_threads=1)
+    models = make_models(4)
+    windows = np.random.default_rng(1).random((4, 60), dtype=np.float32)
+
+    batched = engine.rollout_batch(models, windows, horizon=7)
+    single = np.stack([engine.rollout(model, window, 7) for model, window in zip(models, windows)])
+
+    assert batched.shape == (4, 7)
+    np.testing.assert_allclose(batched, single, rtol=1e-5, atol=1e-5)
@@ -0,0 +1,61 @@
+# test_model_registry.py - LRU eviction, reload and stale-date handling
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("torch")
+pytest.importorskip("prophet")
+pytest.importorskip("joblib")
+
+from model_registry import ModelRegistry, estimate_size
+
+
+def artifact(tag: str) -> dict:
+    return {"tag": tag, "payload": bytes(1000)}
+
+
+def make_registry(tmp_path, models: int = 2) -> ModelRegistry:
+    budget = estimate_size(artifact("x")) * models + 10
+    return ModelRegistry(str(tmp_path), budget_bytes=budget, lstm_factory=lambda: None)
+
+
+def test_least_recently_used_is_evicted_and_reloaded(tmp_path):
+    registry = make_registry(tmp_path)
+    registry.put('scaler', 'AAA', artifact("a"), last_date=1)
+    registry.put('scaler', 'BBB', artifact("b"), last_date=1)
+    assert registry.get('scaler', 'AAA', 1)["tag"] == "a"  # AAA is now most recent
+    registry.put('scaler', 'CCC', artifact("c"), last_date=1)
+
+    assert registry.has('scaler', 'AAA') and registry.has('scaler', 'CCC')
+    assert not registry.has('scaler', 'BBB')
+    assert registry.evictions == 1
+    # Evicted entries come back from disk
+    assert registry.get('scaler', 'BBB', 1)["tag"] == "b"
+    assert registry.loads == 1
+
+
+def test_stale_last_date_is_a_miss(tmp_path):
+    registry = make_registry(tmp_path)
+    registry.put('scaler', 'AAA', artifact("a"), last_date=1)
+
+    assert registry.get('scaler', 'AAA', 2) is None
+    # The stale resident entry is dropped, and the file is not served either
+    assert not registry.has('scaler', 'AAA')
+    assert registry.get('scaler', 'AAA', 2) is None
+    assert registry.get('scaler', 'AAA', 1)["tag"] == "a"
+
+
+def test_over_budget_artifact_keeps_its_meta_on_disk(tmp_path):
+    registry = make_registry(tmp_path, models=0)
+    registry.put('scaler', 'AAA', artifact("a"), last_date=1, meta={"epochs": 7})
+
+    assert not registry.has('scaler', 'AAA')
+    assert registry.meta('scaler', 'AAA') == {}
+    found = registry.get_with_meta('scaler', 'AAA', 1)
+    assert found is not None
+    assert found[0]["tag"] == "a" and found[1] == {"epochs": 7}
+
+
+def test_save_leaves_no_temp_files(tmp_path):
+    registry = make_registry(tmp_path)
+    registry.put('scaler', 'AAA', artifact("a"), last_date=1)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["AAA_scaler.joblib"]
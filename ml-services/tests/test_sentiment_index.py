@@ -0,0 +1,81 @@
+# test_sentiment_index.py - Incremental sentiment index and the order articles are folded in
+import json
+import math
+import os
+from datetime import datetime
+
+import pytest
+
+from news_pipeline import ArticleStore
+from sentiment_index import SentimentIndex, oldest_first, parse_timestamp, sentiment_to_numeric
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       "news_fixtures", "AAPL.json")
+
+
+def scored(published: str, url: str, sentiment: str = "positive", score: float = 0.9):
+    return {"title": url, "url": url, "published": published, "sentiment": sentiment, "score": score}
+
+
+def fixture_articles():
+    with open(FIXTURE) as f:
+        return [scored(a["published"], a["url"]) for a in json.load(f)]
+
+
+def test_value_is_decayed_weighted_mean():
+    index = SentimentIndex(half_life_hours=24)
+    articles = [scored("2026-10-14T10:00:00", "a", "positive", 0.9),
+                scored("2026-10-15T10:00:00", "b", "negative", 0.8),
+                scored("2026-10-15T22:00:00", "c", "neutral", 0.6)]
+    for a in articles:
+        index.update("AAPL", a["published"], a["sentiment"], a["score"])
+
+    newest = parse_timestamp(articles[-1]["published"])
+    rate = math.log(2) / (24 * 3600)
+    weights = [a["score"] * math.exp(-rate * (newest - parse_timestamp(a["published"]))) for a in articles]
+    values = [sentiment_to_numeric(a["sentiment"], a["score"]) for a in articles]
+    expected = sum(w * v for w, v in zip(weights, values)) / sum(weights)
+    assert index.current("AAPL")["score"] == pytest.approx(expected, abs=1e-4)
+
+
+def test_newest_first_feed_folded_oldest_first_keeps_history():
+    articles = fixture_articles()
+    assert articles == sorted(articles, key=lambda a: a["published"], reverse=True)
+
+    index = SentimentIndex()
+    for a in oldest_first(articles):
+        index.update("AAPL", a["published"], a["sentiment"], a["score"])
+
+    history = index.history("AAPL", datetime(2026, 10, 14).timestamp(), datetime(2026, 10, 15, 23).timestamp())
+    assert [h["timestamp"] for h in history] == ["2026-10-14T16:45:00", "2026-10-15T09:00:00"]
+    assert len(index.history("AAPL", 0, datetime(2027, 1, 1).timestamp())) == 3
+
+
+def test_store_reload_folds_articles_in_publication_order(tmp_path):
+    path = str(tmp_path / "articles.jsonl")
+    # Appended in fetch order: newest first
+    store = ArticleStore(path=path)
+    for a in fixture_articles():
+        store.add("AAPL", a)
+
+    index = SentimentIndex()
+    reloaded = ArticleStore(path=path, on_add=lambda symbol, a: index.update(
+        symbol, a["published"], a["sentiment"], a["score"]))
+
+    assert reloaded.count("AAPL") == 3
+    assert [a["url"] for a in reloaded.recent("AAPL", 3)] == [a["url"] for a in fixture_articles()]
+    assert len(index.history("AAPL", 0, datetime(2027, 1, 1).timestamp())) == 3
+
+
+def test_store_adds_each_url_once():
+    added = []
+    store = ArticleStore(on_add=lambda symbol, a: added.append(a["url"]))
+    assert store.add("AAPL", scored("2026-10-14T10:00:00", "a"))
+    assert not store.add("AAPL", scored("2026-10-14T10:00:00", "a"))
+    assert store.add("MSFT", scored("2026-10-14T10:00:00", "a"))
+    assert added == ["a", "a"]
+
+
+def test_undated_articles_sort_last():
+    articles = [{"url": "undated"}, scored("2026-10-15T09:00:00", "b"), scored("2026-10-14T09:00:00", "a")]
+    assert [a["url"] for a in oldest_first(articles)] == ["a", "b", "undated"]
@@ -0,0 +1,96 @@
+# test_streaming.py - Incremental stream state agrees with the batch fast forecaster
+import asyncio
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+
+from price_series import PriceSeries
+from fast_forecast import fast_forecast
+from streaming import ForecastStream, SymbolStream
+
+
+def make_series(length: int, seed: int = 0) -> PriceSeries:
+    rng = np.random.default_rng(seed)
+    close = (100 * np.exp(np.cumsum(rng.normal(0.0005, 0.02, length)))).astype(np.float32)
+    dates = 1_600_000_000 + 86400 * np.arange(length, dtype=np.int64)
+    empty = np.full(length, np.nan, dtype=np.float32)
+    return PriceSeries("TEST", dates, close, np.ones(length, dtype=np.float32),
+                       empty, empty, empty, empty)
+
+
+def test_updates_match_fast_forecast_on_the_same_bars():
+    series = make_series(200)
+    state = SymbolStream(series.slice(0, 120))
+    for i in range(120, 200):
+        state.update(int(series.dates[i]), float(series.close[i]))
+
+    streamed = state.forecast(7)
+    batch = fast_forecast(series.close[np.newaxis], 7)
+    for key in ("mean", "lower", "upper", "confidence"):
+        np.testing.assert_allclose(streamed[key], batch[key][0], rtol=1e-7)
+
+
+def test_return_window_slides_with_new_bars():
+    series = make_series(400, seed=1)
+    state = SymbolStream(series.slice(0, 300), window=252)
+    for i in range(300, 400):
+        state.update(int(series.dates[i]), float(series.close[i]))
+
+    returns = np.diff(np.log(series.close[-252:].astype(np.float64)))
+    assert state.returns_sum == pytest.approx(returns.sum(), rel=1e-9, abs=1e-10)
+    assert state.returns_sumsq == pytest.approx((returns ** 2).sum(), rel=1e-9)
+
+
+class StubPredictor:
+    def __init__(self, series=None):
+        self.series = series
+        self.series_listeners = []
+        self.lstm_calls = 0
+
+    async def _fetch_data(self, symbol):
+        return self.series
+
+    def lstm_update(self, symbol, closes, horizon):
+        self.lstm_calls += 1
+        return None
+
+    def refetched(self, symbol, series):
+        for listener in self.series_listeners:
+            listener(symbol, series)
+
+
+def test_refetched_series_feeds_only_newer_bars():
+    predictor = StubPredictor()
+    stream = ForecastStream(predictor)
+    series = make_series(150)
+    stream.seed("TEST", series.slice(0, 140))
+
+    predictor.refetched("TEST", series)
+    assert stream.bars_processed == 10
+    predictor.refetched("TEST", series)
+    assert stream.bars_processed == 10
+    # Nobody subscribed: state advances but no message (or LSTM rollout) is built
+    assert predictor.lstm_calls == 0
+    assert stream.updates_sent == 0
+
+
+def test_catch_up_publishes_once_and_last_unsubscribe_drops_state():
+    series = make_series(150)
+    predictor = StubPredictor(series.slice(0, 140))
+    stream = ForecastStream(predictor)
+
+    async def scenario():
+        queue = asyncio.Queue(maxsize=8)
+        assert await stream.subscribe("TEST", queue)
+        predictor.refetched("TEST", series)
+        messages = [queue.get_nowait() for _ in range(queue.qsize())]
+        stream.unsubscribe("TEST", queue)
+        return messages
+
+    messages = asyncio.run(scenario())
+    assert [message["type"] for message in messages] == ["snapshot", "update"]
+    assert messages[-1]["bar"]["close"] == pytest.approx(float(series.close[-1]))
+    assert stream.bars_processed == 10
+    assert stream.stats()["symbols"] == 0
@@ -0,0 +1,73 @@
+# workers.py - Shared-weight multi-worker deployment helpers
+import gc
+import os
+import sys
+import json
+from typing import Dict, Any, List
+
+# Fields of /proc/<pid>/smaps_rollup worth reporting, in kB
+SMAPS_FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+
+
+def process_memory(pid: int = 0) -> Dict[str, Any]:
+    """Resident memory of a process, split into shared and private pages.
+
+    Pss (proportional set size) divides shared pages between the processes
+    mapping them, so summing Pss across workers gives the real node footprint.
+    """
+    pid = pid or os.getpid()
+    report: Dict[str, Any] = {"pid": pid}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                key = parts[0].rstrip(':')
+                if key in SMAPS_FIELDS:
+                    report[f"{key.lower()}_bytes"] = int(parts[1]) * 1024
+    except OSError:
+        # Non-Linux: only the peak RSS of the current process is available
+        # (and nothing at all on Windows, which has no resource module)
+        if pid == os.getpid():
+            try:
+                import resource
+            except ImportError:
+                return report
+            scale = 1 if sys.platform == 'darwin' else 1024
+            report["max_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    return report
+
+
+def child_pids(pid: int) -> List[int]:
+    """Direct children of pid, e.g. the workers of a gunicorn master"""
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def freeze_for_fork():
+    """Move preloaded objects out of GC tracking before forking workers.
+
+    Without this the first collection in each worker writes to the GC
+    headers of every model object, copying the shared pages holding them.
+    """
+    gc.collect()
+    gc.freeze()
+
+
+def on_worker_start():
+    """Per-worker setup after fork: torch thread pools don't survive fork"""
+    from inference import configure_torch_threads
+    configure_torch_threads()
+
+
+if __name__ == "__main__":
+    # Usage: python workers.py <gunicorn master pid>
+    master = int(sys.argv[1]) if len(sys.argv) > 1 else os.getpid()
+    reports = [process_memory(master)] + [process_memory(child) for child in child_pids(master)]
+    print(json.dumps({
+        "processes": reports,
+        "total_pss_bytes": sum(r.get("pss_bytes", 0) for r in reports),
+        "total_rss_bytes": sum(r.get("rss_bytes", 0) for r in reports)
+    }, indent=2))